@@ -0,0 +1,314 @@
+"""Benchmarks for the intake workflows against synthetic databases.
+
+Builds throwaway databases of the requested sizes (visits), times the core
+data-layer calls and runs a multi-process writer simulation against one
+SQLite file. Startup is timed too: a fresh process and a fresh database per
+run, until the first page has rendered. Results are written as JSON so runs
+can be compared:
+
+    python bench_intake.py --sizes 10000 100000 --out bench.json
+    python bench_intake.py --sizes 10000 --compare bench.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Never touch the real submissions.db, even at import time
+os.environ.setdefault("FOODBANK_DB_FILE", os.path.join(tempfile.gettempdir(), "foodbank_bench_import.db"))
+
+import database
+from database import Household, Visit, normalize_phone
+import duplicates
+import export_submissions
+import outbox
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food_bank_app.py")
+STARTUP_SECTIONS = ["Privacy Notice", "Quick Check-In", "New Submission", "Admin"]
+VISITS_PER_HOUSEHOLD = 4
+INSERT_CHUNK = 10_000
+FIRST_NAMES = ["Maria", "Jose", "Ana", "James", "Linda", "Carlos", "Mary", "David", "Rosa", "John"]
+LAST_NAMES = ["Garcia", "Smith", "Johnson", "Lopez", "Brown", "Nguyen", "Williams", "Martinez", "Davis", "Lee"]
+REFERRALS = ["Church", "Friend", "Flyer", "School", "Volunteer"]
+SCHOOL_LEVELS = ["", "Pre-K", "Elementary", "Middle School", "High School", "Elementary, Middle School"]
+
+def phone_for(household_id):
+    return f"{2140000000 + household_id}"
+
+# Bulk-load a synthetic history of `visits` visits straight through Core inserts
+def build_database(path, visits, seed=0):
+    rng = random.Random(seed)
+    database.configure(path)
+    households = max(1, visits // VISITS_PER_HOUSEHOLD)
+    with database.engine.begin() as conn:
+        for start in range(1, households + 1, INSERT_CHUNK):
+            conn.execute(Household.__table__.insert(), [
+                {
+                    "id": i,
+                    "Household": rng.randint(1, 8),
+                    "Male_Adults": rng.randint(0, 2),
+                    "Male_Ages": str(rng.randint(18, 90)),
+                    "Female_Adults": rng.randint(0, 2),
+                    "Female_Ages": str(rng.randint(18, 90)),
+                    "Number_of_Children": rng.randint(0, 4),
+                    "Kids_Ages": ", ".join(str(rng.randint(0, 17)) for _ in range(rng.randint(0, 3))),
+                    "School_Levels": rng.choice(SCHOOL_LEVELS),
+                    "Zip": f"75{rng.randint(0, 999):03d}",
+                    "Referral": rng.choice(REFERRALS),
+                    "Phone": phone_for(i),
+                    "Phone_clean": normalize_phone(phone_for(i)),
+                    "Email": f"client{i}@example.org",
+                    "Name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                }
+                for i in range(start, min(start + INSERT_CHUNK, households + 1))
+            ])
+        first_day = datetime(2022, 1, 1)
+        seen = set()  # (household, day): one visit per household per day
+        for start in range(0, visits, INSERT_CHUNK):
+            rows = []
+            while len(rows) < min(INSERT_CHUNK, visits - start):
+                household_id, day = rng.randint(1, households), rng.randint(0, 1000)
+                if (household_id, day) in seen:
+                    continue
+                seen.add((household_id, day))
+                rows.append({
+                    "household_id": household_id,
+                    "Timestamp": (first_day + timedelta(days=day, minutes=rng.randint(480, 960))).strftime("%Y-%m-%d %H:%M:%S"),
+                    "Arrival_Mode": rng.choice(["Walking", "Driving"]),
+                })
+            conn.execute(Visit.__table__.insert(), rows)
+        database.rebuild_rollups(conn)
+        database.backfill_demographics(conn)
+    return households
+
+def summarize(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(ms[len(ms) // 2], 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+# Time fn(i) for i in range(repeat)
+def time_op(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_size(path, visits, repeat):
+    rng = random.Random(1)
+    start = time.perf_counter()
+    households = build_database(path, visits)
+    results = {"build_s": round(time.perf_counter() - start, 2), "households": households}
+    new_phone = iter(range(households + 1, households + 1 + 10 * repeat))
+
+    def save(i):
+        database.save_submission({
+            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Household": 3, "Phone": phone_for(next(new_phone)), "Name": "Bench Client",
+            "Zip": "75243", "Arrival Mode": "Walking",
+        })
+
+    # No sync thread: it would write into this database during the timed ops
+    # and keep going into the next size's. outbox_drain syncs explicitly.
+    local_outbox = outbox.Outbox(path + ".outbox", background=False)
+
+    def outbox_append(i):
+        local_outbox.append({
+            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Household": 3, "Phone": phone_for(next(new_phone)), "Arrival Mode": "Walking",
+        })
+
+    ops = {
+        "load_submissions": (lambda i: database.load_submissions(), min(repeat, 3)),
+        "save_submission": (save, repeat),
+        "outbox_append": (outbox_append, repeat),
+        "outbox_drain": (lambda i: local_outbox.drain(), 1),
+        "phone_lookup": (lambda i: database.find_submissions_by_phone(phone_for(rng.randint(1, households))), repeat),
+        # Households 1..repeat checked in today, then again (already checked in)
+        "check_in": (lambda i: database.check_in(phone_for(i + 1), "Walking"), repeat),
+        "check_in_duplicate": (lambda i: database.check_in(phone_for(i + 1), "Walking"), repeat),
+        "phone_exists": (lambda i: database.phone_exists(phone_for(rng.randint(1, households))), repeat),
+        "admin_count_day": (lambda i: database.count_submissions("2023-06-03", "2023-06-04"), repeat),
+        "admin_page_day": (lambda i: database.query_submissions("2023-06-03", "2023-06-04", database.PAGE_SIZE, 0), repeat),
+        "report_day": (lambda i: database.daily_visit_count("2023-06-03"), repeat),
+        "report_saturdays": (lambda i: database.weekday_stats(6, database.PAGE_SIZE, 0), repeat),
+        "report_weekly": (lambda i: database.weekly_stats(database.PAGE_SIZE, 0), repeat),
+        "report_zip_month": (lambda i: database.zip_distribution("2023-06-01", "2023-07-01"), repeat),
+        "report_ages_month": (lambda i: database.age_breakdown("2023-06-01", "2023-07-01"), repeat),
+        "report_school_levels_month": (lambda i: database.school_level_breakdown("2023-06-01", "2023-07-01"), repeat),
+        "duplicate_check": (lambda i: duplicates.find_duplicate_candidates({
+            "Name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "Zip": f"75{rng.randint(0, 999):03d}",
+            "Phone": phone_for(rng.randint(1, households)), "Household": 3,
+        }), repeat),
+        "duplicate_scan": (lambda i: sum(1 for _ in duplicates.find_duplicate_pairs()), 1),
+        "admin_search": (lambda i: database.search_submissions(rng.choice(LAST_NAMES + FIRST_NAMES)[:4]), repeat),
+        "export_csv": (lambda i: export_to_devnull(), min(repeat, 3)),
+    }
+    for name, (fn, n) in ops.items():
+        results[name] = time_op(fn, n)
+    local_outbox.engine.dispose()
+    return results
+
+def export_to_devnull():
+    with open(os.devnull, "w", newline="") as f:
+        export_submissions.write_csv(f, export_submissions.iter_submission_rows())
+
+def writer_process(path, worker, count, ready, results):
+    samples, failures = [], 0
+    try:
+        database.configure(path)
+        # Start writing together once every process has finished importing
+        ready.wait()
+        for i in range(count):
+            start = time.perf_counter()
+            ok = database.save_submission({
+                "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "Household": 2, "Phone": f"469{worker:03d}{i:04d}", "Arrival Mode": "Driving",
+            })
+            samples.append(time.perf_counter() - start)
+            failures += not ok
+    finally:
+        # Always report back so the parent never waits on a dead worker
+        results.put((samples, failures + count - len(samples)))
+
+# Several processes saving into the same SQLite file at once, like tablets on a Saturday
+def bench_concurrent_writers(path, writers, per_writer):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    ready = ctx.Barrier(writers + 1)
+    procs = [ctx.Process(target=writer_process, args=(path, w, per_writer, ready, results)) for w in range(writers)]
+    for p in procs:
+        p.start()
+    ready.wait()
+    start = time.perf_counter()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+    samples = [s for worker_samples, _ in collected for s in worker_samples]
+    return {
+        "writers": writers,
+        "writes": len(samples),
+        "failures": sum(f for _, f in collected),
+        "writes_per_s": round(len(samples) / elapsed, 1),
+        **summarize(samples),
+    }
+
+# Run in a fresh interpreter: render one section once, report timings as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+loaded = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.session_state["section"] = sys.argv[2]
+at.run()
+done = time.perf_counter()
+print(json.dumps({
+    "streamlit_import_s": loaded - start,
+    "first_render_s": done - loaded,
+    "errors": len(at.exception),
+    "pandas_loaded": "pandas" in sys.modules,
+}))
+"""
+
+# Time-to-first-render of each section: new process, new database file
+def bench_startup(runs, tmp):
+    results = {}
+    for section in STARTUP_SECTIONS:
+        samples, renders, child = [], [], {}
+        for run in range(runs):
+            env = dict(os.environ, FOODBANK_DB_FILE=os.path.join(tmp, f"startup_{section[:3]}_{run}.db"))
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT, APP_FILE, section],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(time.perf_counter() - start)
+            child = json.loads(out.strip().splitlines()[-1])
+            renders.append(child["first_render_s"])
+        results[section] = {
+            **summarize(samples),
+            "first_render_ms": round(statistics.fmean(renders) * 1000, 3),
+            "pandas_loaded": child["pandas_loaded"],
+            "errors": child["errors"],
+        }
+    return results
+
+# Ops whose mean got slower than baseline by more than `tolerance` (0.25 = 25%)
+def find_regressions(current, baseline, tolerance):
+    regressions = []
+    groups = [(size, ops, baseline.get("sizes", {}).get(size, {})) for size, ops in current["sizes"].items()]
+    groups.append(("startup", current.get("startup", {}), baseline.get("startup", {})))
+    for size, ops, base_ops in groups:
+        for op, stats in ops.items():
+            base = base_ops.get(op)
+            if isinstance(stats, dict) and isinstance(base, dict) and base.get("mean_ms"):
+                if stats["mean_ms"] > base["mean_ms"] * (1 + tolerance):
+                    regressions.append({"size": size, "op": op, "baseline_ms": base["mean_ms"], "current_ms": stats["mean_ms"]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the intake data layer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="visits per synthetic database")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per operation")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writer processes")
+    parser.add_argument("--writes", type=int, default=100, help="submissions per writer")
+    parser.add_argument("--startup-runs", type=int, default=3, help="fresh processes per section (0 to skip)")
+    parser.add_argument("--out", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for visits in args.sizes:
+            print(f"Benchmarking {visits} visits...", file=sys.stderr)
+            report["sizes"][str(visits)] = bench_size(os.path.join(tmp, f"bench_{visits}.db"), visits, args.repeat)
+        print("Benchmarking concurrent writers...", file=sys.stderr)
+        path = os.path.join(tmp, "bench_writers.db")
+        build_database(path, min(args.sizes))
+        database.engine.dispose()
+        report["concurrent_writers"] = bench_concurrent_writers(path, args.writers, args.writes)
+        if args.startup_runs:
+            print("Benchmarking startup...", file=sys.stderr)
+            report["startup"] = bench_startup(args.startup_runs, tmp)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = find_regressions(report, json.load(f), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
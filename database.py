@@ -0,0 +1,1063 @@
+"""Storage for the intake app: SQLAlchemy models, migrations and queries.
+
+Kept free of Streamlit so command-line tools can share it with the UI.
+"""
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    create_engine, event, Boolean, Column, Enum, Index, String, Integer, ForeignKey,
+    bindparam, case, delete, func, insert, inspect, or_, select, text, update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.sql import column, table
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from instrumentation import log, redact, span, timed
+
+# pandas is imported inside the functions that build DataFrames: it costs
+# more at startup than everything else here, and intake pages rarely need it.
+
+DB_FILE = os.environ.get("FOODBANK_DB_FILE", "submissions.db")
+COLUMNS = [
+    "Timestamp", "Household", "Male Adults", "Male Ages", "Female Adults", "Female Ages",
+    "Number of Children", "Kids Ages", "School Levels", "Zip", "Referral", "Phone", "Email", "Name", "Arrival Mode"
+]
+# Rows per page in the admin log views
+PAGE_SIZE = 50
+
+# Concurrent-intake tuning: several tablets write through one server
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("FOODBANK_BUSY_TIMEOUT", "30"))  # seconds to wait on a lock
+SQLITE_POOL_SIZE = int(os.environ.get("FOODBANK_POOL_SIZE", "5"))
+
+def create_db_engine(db_file):
+    engine = create_engine(
+        f"sqlite:///{db_file}", echo=False, future=True,
+        poolclass=QueuePool, pool_size=SQLITE_POOL_SIZE, max_overflow=10,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT, "check_same_thread": False},
+        # Keep client details out of error messages ("[parameters: ...]"),
+        # which get logged next to the redacted row
+        hide_parameters=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers keep going while a volunteer's submission commits
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.close()
+        # Let SQLAlchemy issue BEGIN itself (see begin_transaction)
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(conn):
+        # Writers take the lock up front. A deferred transaction that reads and
+        # then writes can fail with "database is locked" without waiting.
+        if conn.get_execution_options().get("sqlite_immediate"):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+# SQLAlchemy setup (declarative)
+Base = declarative_base()
+engine = create_db_engine(DB_FILE)
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
+# Sessions for writes: BEGIN IMMEDIATE, waiting up to SQLITE_BUSY_TIMEOUT for the lock
+WriteSession = sessionmaker(bind=engine.execution_options(sqlite_immediate=True), expire_on_commit=False, future=True)
+
+# Core equivalent of WriteSession, for bulk jobs: engine_for_writes().begin()
+def engine_for_writes():
+    return engine.execution_options(sqlite_immediate=True)
+
+# Household model: who the client is, stored once
+class Household(Base):
+    __tablename__ = "households"
+    id = Column(Integer, primary_key=True, index=True)
+    Household = Column(Integer)
+    Male_Adults = Column(Integer)
+    Male_Ages = Column(String)
+    Female_Adults = Column(Integer)
+    Female_Ages = Column(String)
+    Number_of_Children = Column(Integer)
+    Kids_Ages = Column(String)
+    School_Levels = Column(String)
+    Zip = Column(String)
+    Referral = Column(String)
+    Phone = Column(String)
+    # Digits-only copy of Phone so lookups are indexed point queries
+    Phone_clean = Column(String, index=True)
+    Email = Column(String, index=True)
+    Name = Column(String)
+    # Bumped by every update; edits compare-and-swap on it (update_submission_by_id)
+    Version = Column(Integer, nullable=False, default=1)
+    # Soundex of the family name, filled from Name on insert. With Zip it is
+    # the blocking key for duplicate detection (see duplicates.py).
+    Name_Key = Column(String, default=lambda context: name_key(context.get_current_parameters().get("Name")))
+    __table_args__ = (Index("ix_households_zip_name_key", "Zip", "Name_Key"),)
+
+# Visit model: append-only log, one small row per visit
+class Visit(Base):
+    __tablename__ = "visits"
+    id = Column(Integer, primary_key=True, index=True)
+    household_id = Column(Integer, ForeignKey("households.id"), nullable=False, index=True)
+    # "YYYY-MM-DD HH:MM:SS" strings sort chronologically, so date ranges use this index
+    Timestamp = Column(String, index=True)
+    Arrival_Mode = Column(String)
+    # Day of the visit, filled from Timestamp on insert. One check-in per
+    # household per day; NULL only on same-day duplicates from before the rule.
+    Visit_Date = Column(String, default=lambda context: visit_date(context.get_current_parameters().get("Timestamp")))
+    # Id the submitting client generated, so a retried submission is recorded once
+    Client_Id = Column(String)
+    __table_args__ = (
+        Index("uq_visits_household_date", "household_id", "Visit_Date", unique=True),
+        Index("uq_visits_client_id", "Client_Id", unique=True),
+    )
+
+# Single-row write counter. Every write bumps it in the same transaction, so
+# readers can cache query results until the version they were built from changes.
+class DataVersion(Base):
+    __tablename__ = "data_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Single-row marker: visits before Archived_Before (a Monday) have moved to
+# the yearly archives (see retention.py). Their rollup rows are kept and no
+# longer recomputed, since the visits they were built from are gone.
+class ArchiveState(Base):
+    __tablename__ = "archive_state"
+    id = Column(Integer, primary_key=True)
+    Archived_Before = Column(String)
+
+# Pre-aggregated report tables, one row per day / week (Monday) and per zip.
+# Writes refresh only the buckets they touch (see refresh_rollups), so
+# reports read a handful of rows however long the visit history gets.
+class RollupColumns:
+    Visits = Column(Integer, nullable=False, default=0)
+    Households = Column(Integer, nullable=False, default=0)  # unique households
+    Individuals = Column(Integer, nullable=False, default=0)  # sum of household sizes
+    Male_Adults = Column(Integer, nullable=False, default=0)
+    Female_Adults = Column(Integer, nullable=False, default=0)
+    Children = Column(Integer, nullable=False, default=0)
+    Walking = Column(Integer, nullable=False, default=0)
+    Driving = Column(Integer, nullable=False, default=0)
+
+class DailyStats(RollupColumns, Base):
+    __tablename__ = "daily_stats"
+    Period = Column(String, primary_key=True)  # YYYY-MM-DD
+
+class WeeklyStats(RollupColumns, Base):
+    __tablename__ = "weekly_stats"
+    Period = Column(String, primary_key=True)  # Monday, YYYY-MM-DD
+
+class DailyZipStats(RollupColumns, Base):
+    __tablename__ = "daily_zip_stats"
+    Period = Column(String, primary_key=True)
+    Zip = Column(String, primary_key=True)
+
+class WeeklyZipStats(RollupColumns, Base):
+    __tablename__ = "weekly_zip_stats"
+    Period = Column(String, primary_key=True)
+    Zip = Column(String, primary_key=True)
+
+# Canonical school levels; free-text answers are mapped onto these
+SCHOOL_LEVELS = ["No School", "Pre-K", "Elementary", "Middle School", "High School"]
+
+# One row per age listed on the intake form, parsed from the free-text age lists
+class HouseholdAge(Base):
+    __tablename__ = "household_ages"
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey("households.id"), nullable=False, index=True)
+    Sex = Column(String)  # "M" or "F"; None for children (not asked on the form)
+    Child = Column(Boolean, nullable=False)
+    Age = Column(Integer, nullable=False)
+
+# School levels a household's children attend, one row per level
+class HouseholdSchoolLevel(Base):
+    __tablename__ = "household_school_levels"
+    household_id = Column(Integer, ForeignKey("households.id"), primary_key=True)
+    Level = Column(Enum(*SCHOOL_LEVELS, name="school_level"), primary_key=True)
+
+HOUSEHOLD_FIELDS = {
+    "Household": "Household",
+    "Male Adults": "Male_Adults",
+    "Male Ages": "Male_Ages",
+    "Female Adults": "Female_Adults",
+    "Female Ages": "Female_Ages",
+    "Number of Children": "Number_of_Children",
+    "Kids Ages": "Kids_Ages",
+    "School Levels": "School_Levels",
+    "Zip": "Zip",
+    "Referral": "Referral",
+    "Phone": "Phone",
+    "Email": "Email",
+    "Name": "Name",
+}
+VISIT_FIELDS = {
+    "Timestamp": "Timestamp",
+    "Arrival Mode": "Arrival_Mode",
+}
+
+# Context-managed session utility
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def normalize_phone(phone):
+    return ''.join(filter(str.isdigit, str(phone)))
+
+SOUNDEX_CODES = {c: digit for digit, letters in [("1", "bfpv"), ("2", "cgjkqsxz"), ("3", "dt"), ("4", "l"), ("5", "mn"), ("6", "r")] for c in letters}
+
+def soundex(word):
+    word = re.sub(r"[^a-z]", "", word.lower())
+    if not word:
+        return ""
+    code, last = word[0].upper(), SOUNDEX_CODES.get(word[0])
+    for c in word[1:]:
+        digit = SOUNDEX_CODES.get(c)
+        if digit and digit != last:
+            code += digit
+        if c not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+# Phonetic key of the family (last) name, e.g. "Ana Garsia" -> "G620"
+def name_key(name):
+    words = re.findall(r"[a-z]+", (name or "").lower())
+    return soundex(words[-1]) if words else None
+
+def visit_date(timestamp):
+    return timestamp[:10] if timestamp else None
+
+# One-time migration from the old single `submissions` table. Each phone
+# becomes one household (the latest row's details win) and every row becomes
+# a visit. The old table is kept as `submissions_legacy`.
+def migrate_legacy_submissions():
+    if "submissions" not in inspect(engine).get_table_names():
+        return
+    with WriteSession() as session:
+        rows = session.execute(text("SELECT * FROM submissions ORDER BY id")).mappings().all()
+        households = {}
+        visits = []
+        seen_days = set()
+        for row in rows:
+            # Older databases used "Male Adults", newer ones "Male_Adults"
+            def value(label):
+                return row.get(label, row.get(label.replace(" ", "_")))
+            phone_clean = normalize_phone(value("Phone") or "")
+            key = phone_clean or f"row-{row['id']}"
+            household = households.get(key)
+            if household is None:
+                household = Household(Phone_clean=phone_clean)
+                households[key] = household
+                session.add(household)
+            for label, attr in HOUSEHOLD_FIELDS.items():
+                setattr(household, attr, value(label))
+            session.flush()
+            day = visit_date(value("Timestamp"))
+            visits.append({
+                "household_id": household.id,
+                "Timestamp": value("Timestamp"),
+                "Arrival_Mode": value("Arrival Mode"),
+                "Visit_Date": None if (household.id, day) in seen_days else day,
+                "Client_Id": None,
+            })
+            seen_days.add((household.id, day))
+        # Core insert on the table: an explicit None must stay NULL, where the
+        # ORM would fill Visit_Date from its default and break the unique index
+        if visits:
+            session.execute(insert(Visit.__table__), visits)
+        session.execute(text("ALTER TABLE submissions RENAME TO submissions_legacy"))
+        session.commit()
+
+# Full-text index over the searchable household fields. It is an external
+# content table, so triggers keep it in step with every write to households
+# (save_submission, update_submission_by_id, delete_submission_by_id).
+FTS_COLUMNS = ["Name", "Phone", "Phone_clean", "Email", "Zip", "Referral", "School_Levels"]
+FTS_ENABLED = True
+households_fts = table("households_fts", column("rowid"), column("rank"))
+
+def create_search_index(conn):
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'households_fts'")).first()
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS households_fts USING fts5({columns}, "
+        f"content='households', content_rowid='id', prefix='2 3')"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS households_fts_insert AFTER INSERT ON households BEGIN "
+        f"INSERT INTO households_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS households_fts_delete AFTER DELETE ON households BEGIN "
+        f"INSERT INTO households_fts(households_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS households_fts_update AFTER UPDATE ON households BEGIN "
+        f"INSERT INTO households_fts(households_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO households_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    ))
+    if not exists:
+        conn.execute(text("INSERT INTO households_fts(households_fts) VALUES ('rebuild')"))
+
+# ------------------ Demographics ------------------
+# Age lists and school levels are parsed once, when a household is written,
+# with the same patterns for single rows (regex) and for backfills (pandas
+# .str.extractall over whole columns).
+
+AGE_PATTERN = r"(\d{1,3})(?:\.\d+)?"
+MAX_AGE = 120
+# (household column, Sex, Child)
+AGE_SOURCES = [("Male_Ages", "M", False), ("Female_Ages", "F", False), ("Kids_Ages", None, True)]
+# Earlier alternatives win, so "junior high" is Middle School, not High School
+SCHOOL_LEVEL_PATTERNS = [
+    ("No School", r"no\s*school|\bnone\b|\bn/?a\b"),
+    ("Pre-K", r"pre[\s-]*k\w*|pre[\s-]*school|head\s*start|daycare"),
+    ("Elementary", r"elem\w*|primary|kinder\w*"),
+    ("Middle School", r"middle|junior\s*high|jr\.?\s*high"),
+    ("High School", r"high|\bhs\b"),
+]
+SCHOOL_LEVEL_REGEX = "|".join(f"(?P<level{i}>{pattern})" for i, (_, pattern) in enumerate(SCHOOL_LEVEL_PATTERNS))
+DEMOGRAPHIC_ATTRS = {"Male_Ages", "Female_Ages", "Kids_Ages", "School_Levels"}
+BACKFILL_CHUNK = 50_000
+
+def parse_ages(value):
+    return [age for age in map(int, re.findall(AGE_PATTERN, str(value or ""))) if age <= MAX_AGE]
+
+def parse_school_levels(value):
+    found = {SCHOOL_LEVEL_PATTERNS[int(m.lastgroup[5:])][0] for m in re.finditer(SCHOOL_LEVEL_REGEX, str(value or "").lower())}
+    return [level for level in SCHOOL_LEVELS if level in found]
+
+# Replace one household's parsed rows, inside the caller's transaction
+def store_household_demographics(session, household):
+    clear_demographics(session, [household.id])
+    ages = [
+        {"household_id": household.id, "Sex": sex, "Child": child, "Age": age}
+        for attr, sex, child in AGE_SOURCES for age in parse_ages(getattr(household, attr))
+    ]
+    levels = [{"household_id": household.id, "Level": level} for level in parse_school_levels(household.School_Levels)]
+    if ages:
+        session.execute(insert(HouseholdAge), ages)
+    if levels:
+        session.execute(insert(HouseholdSchoolLevel), levels)
+
+def clear_demographics(session, household_ids):
+    session.execute(delete(HouseholdAge).where(HouseholdAge.household_id.in_(household_ids)))
+    session.execute(delete(HouseholdSchoolLevel).where(HouseholdSchoolLevel.household_id.in_(household_ids)))
+
+# Vectorized parse of a DataFrame of households (indexed by id, with the
+# AGE_SOURCES columns and School_Levels) into household_ages and
+# household_school_levels rows
+def demographic_frames(households):
+    import pandas as pd
+    ages = []
+    for attr, sex, child in AGE_SOURCES:
+        found = households[attr].fillna("").astype(str).str.extractall(AGE_PATTERN)[0].astype(int)
+        found = found[found <= MAX_AGE]
+        ages.append(pd.DataFrame({
+            "household_id": found.index.get_level_values(0),
+            "Sex": sex,
+            "Child": child,
+            "Age": found.to_numpy(),
+        }))
+    matches = households["School_Levels"].fillna("").astype(str).str.lower().str.extractall(SCHOOL_LEVEL_REGEX)
+    labels = [level for level, _ in SCHOOL_LEVEL_PATTERNS]
+    levels = pd.DataFrame({
+        "household_id": matches.index.get_level_values(0),
+        "Level": [labels[i] for i in matches.notna().to_numpy().argmax(axis=1)] if len(matches) else [],
+    }).drop_duplicates()
+    return pd.concat(ages, ignore_index=True), levels
+
+def insert_demographics(conn, households):
+    ages, levels = demographic_frames(households)
+    if len(ages):
+        conn.execute(insert(HouseholdAge), ages.to_dict("records"))
+    if len(levels):
+        conn.execute(insert(HouseholdSchoolLevel), levels.to_dict("records"))
+
+# Re-parse every household, BACKFILL_CHUNK at a time in id order
+def backfill_demographics(conn):
+    import pandas as pd
+    conn.execute(delete(HouseholdAge))
+    conn.execute(delete(HouseholdSchoolLevel))
+    columns = [Household.id] + [getattr(Household, attr) for attr, _, _ in AGE_SOURCES] + [Household.School_Levels]
+    last_id = 0
+    while True:
+        chunk = pd.read_sql(
+            select(*columns).where(Household.id > last_id).order_by(Household.id).limit(BACKFILL_CHUNK),
+            conn, index_col="id",
+        )
+        if chunk.empty:
+            break
+        insert_demographics(conn, chunk)
+        last_id = int(chunk.index[-1])
+
+# ------------------ Rollups ------------------
+
+DAY_BUCKET = "substr(v.Timestamp, 1, 10)"
+WEEK_BUCKET = "date(v.Timestamp, 'weekday 0', '-6 days')"  # Monday of the visit's week
+ROLLUP_METRICS = "Visits, Households, Individuals, Male_Adults, Female_Adults, Children, Walking, Driving"
+ROLLUP_AGGREGATES = """
+    COUNT(*), COUNT(DISTINCT v.household_id),
+    COALESCE(SUM(h.Household), 0), COALESCE(SUM(h.Male_Adults), 0),
+    COALESCE(SUM(h.Female_Adults), 0), COALESCE(SUM(h.Number_of_Children), 0),
+    COALESCE(SUM(v.Arrival_Mode = 'Walking'), 0), COALESCE(SUM(v.Arrival_Mode = 'Driving'), 0)
+"""
+# (table, bucket expression, grouped by zip too)
+DAILY_ROLLUPS = [("daily_stats", DAY_BUCKET, False), ("daily_zip_stats", DAY_BUCKET, True)]
+WEEKLY_ROLLUPS = [("weekly_stats", WEEK_BUCKET, False), ("weekly_zip_stats", WEEK_BUCKET, True)]
+
+def rollup_insert_sql(name, bucket, by_zip, where):
+    keys, group = ("Period, Zip", "1, 2") if by_zip else ("Period", "1")
+    key_exprs = f"{bucket}, COALESCE(h.Zip, '')" if by_zip else bucket
+    return text(
+        f"INSERT INTO {name} ({keys}, {ROLLUP_METRICS}) "
+        f"SELECT {key_exprs}, {ROLLUP_AGGREGATES} "
+        "FROM visits v JOIN households h ON h.id = v.household_id "
+        f"WHERE {where} GROUP BY {group}"
+    )
+
+def week_start(day):
+    d = datetime.strptime(day, "%Y-%m-%d")
+    return (d - timedelta(days=d.weekday())).strftime("%Y-%m-%d")
+
+def is_day(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def is_timestamp(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def refresh_bucket(session, rollups, period, start, end):
+    for name, bucket, by_zip in rollups:
+        session.execute(text(f"DELETE FROM {name} WHERE Period = :period"), {"period": period})
+        session.execute(
+            rollup_insert_sql(name, bucket, by_zip, "v.Timestamp >= :start AND v.Timestamp < :end"),
+            {"start": start, "end": end},
+        )
+
+# First day still in the visits table, or None if nothing was archived
+def archived_before(session):
+    return session.execute(select(ArchiveState.Archived_Before).where(ArchiveState.id == 1)).scalar()
+
+# Recompute the day and week buckets containing `timestamps`, inside the
+# caller's transaction (Session or Core connection). Each bucket is an
+# indexed range scan over that day's or week's visits only. Archived
+# buckets are left as they are.
+def refresh_rollups(session, timestamps):
+    horizon = archived_before(session) or ""
+    days = {ts[:10] for ts in timestamps if ts and is_day(ts[:10]) and ts[:10] >= horizon}
+    for day in days:
+        refresh_bucket(session, DAILY_ROLLUPS, day, day, next_day(day))
+    for monday in {week_start(day) for day in days}:
+        end = (datetime.strptime(monday, "%Y-%m-%d") + timedelta(days=7)).strftime("%Y-%m-%d")
+        refresh_bucket(session, WEEKLY_ROLLUPS, monday, monday, end)
+
+# Recompute every bucket from scratch (migration, repairs), except the
+# archived ones
+def rebuild_rollups(session):
+    horizon = {"horizon": archived_before(session) or ""}
+    for name, bucket, by_zip in DAILY_ROLLUPS + WEEKLY_ROLLUPS:
+        session.execute(text(f"DELETE FROM {name} WHERE Period >= :horizon"), horizon)
+        session.execute(rollup_insert_sql(name, bucket, by_zip, f"{bucket} >= :horizon"), horizon)
+
+# Databases from before one-check-in-per-day: fill Visit_Date, keep the
+# first visit of each household and day and leave same-day repeats NULL
+# (they stay in the history but are not a check-in for that day)
+def add_visit_date(conn):
+    if "Visit_Date" in {c["name"] for c in inspect(conn).get_columns("visits")}:
+        return
+    conn.execute(text('ALTER TABLE visits ADD COLUMN "Visit_Date" VARCHAR'))
+    conn.execute(text(
+        'UPDATE visits SET "Visit_Date" = substr("Timestamp", 1, 10) WHERE id IN '
+        '(SELECT MIN(id) FROM visits WHERE "Timestamp" IS NOT NULL GROUP BY household_id, substr("Timestamp", 1, 10))'
+    ))
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_visits_household_date ON visits (household_id, "Visit_Date")'
+    ))
+
+def add_client_id(conn):
+    if "Client_Id" not in {c["name"] for c in inspect(conn).get_columns("visits")}:
+        conn.execute(text('ALTER TABLE visits ADD COLUMN "Client_Id" VARCHAR'))
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_visits_client_id ON visits ("Client_Id")'))
+
+def add_household_version(conn):
+    if "Version" not in {c["name"] for c in inspect(conn).get_columns("households")}:
+        conn.execute(text('ALTER TABLE households ADD COLUMN "Version" INTEGER NOT NULL DEFAULT 1'))
+
+def add_name_key(conn):
+    if "Name_Key" in {c["name"] for c in inspect(conn).get_columns("households")}:
+        return
+    conn.execute(text('ALTER TABLE households ADD COLUMN "Name_Key" VARCHAR'))
+    rows = conn.execute(select(Household.id, Household.Name).where(Household.Name.isnot(None))).all()
+    if rows:
+        conn.execute(
+            update(Household).where(Household.id == bindparam("household_id")),
+            [{"household_id": household_id, "Name_Key": name_key(name)} for household_id, name in rows],
+        )
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_households_zip_name_key ON households ("Zip", "Name_Key")'))
+
+# Bring an existing database up to the current schema
+def migrate_db():
+    global FTS_ENABLED
+    with engine_for_writes().begin() as conn:
+        add_visit_date(conn)
+        add_household_version(conn)
+        add_client_id(conn)
+        add_name_key(conn)
+    migrate_legacy_submissions()
+    with engine_for_writes().begin() as conn:
+        # create_all only indexes tables it creates itself
+        conn.execute(text('CREATE INDEX IF NOT EXISTS "ix_visits_Timestamp" ON visits ("Timestamp")'))
+        conn.execute(text("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)"))
+        # First run with rollup tables: build them from the existing visits
+        if conn.execute(text("SELECT 1 FROM visits LIMIT 1")).first() and not conn.execute(
+            text("SELECT 1 FROM daily_stats LIMIT 1")
+        ).first():
+            rebuild_rollups(conn)
+        # First run with the demographics tables: parse every household once
+        if conn.execute(text("SELECT 1 FROM households LIMIT 1")).first() and not (
+            conn.execute(text("SELECT 1 FROM household_ages LIMIT 1")).first()
+            or conn.execute(text("SELECT 1 FROM household_school_levels LIMIT 1")).first()
+        ):
+            backfill_demographics(conn)
+    try:
+        with engine_for_writes().begin() as conn:
+            create_search_index(conn)
+    except OperationalError as e:
+        # SQLite built without FTS5: search falls back to LIKE scans
+        log.warning("Full-text search unavailable: %s", e)
+        FTS_ENABLED = False
+
+_initialized = False
+_init_lock = threading.Lock()
+
+# Create missing tables and run migrations, once per process. Entry points
+# (the app, CLIs) call this before their first query; later calls are free.
+def init_db():
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            with span("db.init"):
+                Base.metadata.create_all(bind=engine)
+                migrate_db()
+            _initialized = True
+
+# Point the module at a different database file (benchmarks, tools)
+def configure(db_file):
+    global DB_FILE, engine, _initialized
+    engine.dispose()
+    DB_FILE = db_file
+    engine = create_db_engine(db_file)
+    SessionLocal.configure(bind=engine)
+    WriteSession.configure(bind=engine_for_writes())
+    _initialized = False
+    init_db()
+
+def validate_inputs(phone, email, zip_code):
+    errors = []
+    if not phone or len(normalize_phone(phone)) < 10:
+        errors.append("Please enter a valid phone number.")
+    if email and "@" not in email:
+        errors.append("Please enter a valid email address.")
+    if zip_code and (not zip_code.isdigit() or len(zip_code) != 5):
+        errors.append("Please enter a valid 5-digit zip code.")
+    return errors
+
+@timed("db.load_submissions")
+def load_submissions():
+    with SessionLocal() as session:
+        rows = (
+            session.query(Visit, Household)
+            .join(Household, Visit.household_id == Household.id)
+            .order_by(Visit.id)
+            .all()
+        )
+    return submissions_to_df(rows)
+
+# One submission as a {column label: value} dict; with no visit, the household alone
+def submission_row(v, h):
+    return {
+        "Timestamp": v.Timestamp if v else None,
+        "Household": h.Household,
+        "Male Adults": h.Male_Adults,
+        "Male Ages": h.Male_Ages,
+        "Female Adults": h.Female_Adults,
+        "Female Ages": h.Female_Ages,
+        "Number of Children": h.Number_of_Children,
+        "Kids Ages": h.Kids_Ages,
+        "School Levels": h.School_Levels,
+        "Zip": h.Zip,
+        "Referral": h.Referral,
+        "Phone": h.Phone,
+        "Email": h.Email,
+        "Name": h.Name,
+        "Arrival Mode": v.Arrival_Mode if v else None,
+    }
+
+# Build the flat submissions view from (Visit, Household) pairs, indexed by visit id
+def submissions_to_df(rows):
+    import pandas as pd
+    with span("df.build"):
+        return pd.DataFrame(
+            [submission_row(v, h) for v, h in rows],
+            columns=COLUMNS, index=pd.Index([v.id for v, h in rows], name="id"),
+        )
+
+# One visit for the edit forms: (row dict, household Version), or None.
+# Pass the version back to update_submission_by_id as expected_version.
+@timed("db.get_submission")
+def get_submission(sub_id):
+    with SessionLocal() as session:
+        row = (
+            session.query(Visit, Household)
+            .join(Household, Visit.household_id == Household.id)
+            .filter(Visit.id == sub_id)
+            .first()
+        )
+    if row is None:
+        return None
+    visit, household = row
+    return submission_row(visit, household), household.Version
+
+# The household on file for a phone, even when all its visits are archived:
+# (household id, row dict without visit fields, Version), or None
+@timed("db.get_household_by_phone")
+def get_household_by_phone(phone):
+    with SessionLocal() as session:
+        household = (
+            session.query(Household)
+            .filter(Household.Phone_clean == normalize_phone(phone))
+            .order_by(Household.id)
+            .first()
+        )
+    if household is None:
+        return None
+    return household.id, submission_row(None, household), household.Version
+
+# Indexed lookup of every submission for one phone number
+@timed("db.find_submissions_by_phone")
+def find_submissions_by_phone(phone):
+    phone_clean = normalize_phone(phone)
+    with SessionLocal() as session:
+        rows = (
+            session.query(Visit, Household)
+            .join(Household, Visit.household_id == Household.id)
+            .filter(Household.Phone_clean == phone_clean)
+            .order_by(Visit.id)
+            .all()
+        )
+    return submissions_to_df(rows)
+
+@timed("db.phone_exists")
+def phone_exists(phone):
+    phone_clean = normalize_phone(phone)
+    with SessionLocal() as session:
+        return session.query(Household.id).filter(Household.Phone_clean == phone_clean).first() is not None
+
+# ------------------ Query layer ------------------
+# Filters, grouping and paging run in SQLite against ix_visits_Timestamp.
+# Dates are "YYYY-MM-DD" strings; `end` is exclusive.
+
+def next_day(day):
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+def filter_visits(query, start=None, end=None):
+    if start:
+        query = query.filter(Visit.Timestamp >= start)
+    if end:
+        query = query.filter(Visit.Timestamp < end)
+    return query
+
+@timed("db.count_submissions")
+def count_submissions(start=None, end=None):
+    with SessionLocal() as session:
+        return filter_visits(session.query(func.count(Visit.id)), start, end).scalar()
+
+@timed("db.query_submissions")
+def query_submissions(start=None, end=None, limit=None, offset=0):
+    with SessionLocal() as session:
+        query = filter_visits(
+            session.query(Visit, Household).join(Household, Visit.household_id == Household.id),
+            start, end
+        ).order_by(Visit.Timestamp, Visit.id)
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        rows = query.all()
+    return submissions_to_df(rows)
+
+# Turn free text into an FTS5 query: every word must match, as a prefix
+def fts_query(term):
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", term.lower()))
+
+def search_filter(query, term):
+    if FTS_ENABLED:
+        return query.filter(text("households_fts MATCH :q").bindparams(q=fts_query(term)))
+    pattern = f"%{term}%"
+    return query.filter(or_(*[getattr(Household, c).ilike(pattern) for c in FTS_COLUMNS]))
+
+@timed("db.count_search_results")
+def count_search_results(term):
+    if not fts_query(term):
+        return 0
+    with SessionLocal() as session:
+        query = session.query(func.count(Visit.id)).join(Household, Visit.household_id == Household.id)
+        if FTS_ENABLED:
+            query = query.join(households_fts, households_fts.c.rowid == Household.id)
+        return search_filter(query, term).scalar()
+
+# Visits of households matching `term`, best-ranked (bm25) households first
+@timed("db.search_submissions")
+def search_submissions(term, limit=PAGE_SIZE, offset=0):
+    if not fts_query(term):
+        return submissions_to_df([])
+    with SessionLocal() as session:
+        query = session.query(Visit, Household).join(Household, Visit.household_id == Household.id)
+        if FTS_ENABLED:
+            query = query.join(households_fts, households_fts.c.rowid == Household.id)
+            query = query.order_by(households_fts.c.rank)
+        rows = (
+            search_filter(query, term)
+            .order_by(Visit.Timestamp.desc())
+            .limit(limit).offset(offset)
+            .all()
+        )
+    return submissions_to_df(rows)
+
+# ------------------ Reports (rollup tables) ------------------
+
+ROLLUP_COLUMNS = ["Visits", "Households", "Individuals", "Male_Adults", "Female_Adults", "Children", "Walking", "Driving"]
+
+def rollups_to_df(rows, index_name="date"):
+    import pandas as pd
+    return pd.DataFrame(
+        [[getattr(row, c) for c in ROLLUP_COLUMNS] for row in rows],
+        index=pd.Index([row.Period for row in rows], name=index_name),
+        columns=ROLLUP_COLUMNS,
+    )
+
+@timed("db.daily_visit_count")
+def daily_visit_count(day):
+    with SessionLocal() as session:
+        return session.query(DailyStats.Visits).filter(DailyStats.Period == day).scalar() or 0
+
+# Totals per date for one weekday (SQLite %w: 0 = Sunday ... 6 = Saturday), newest first
+@timed("db.weekday_stats")
+def weekday_stats(weekday=6, limit=None, offset=0):
+    with SessionLocal() as session:
+        query = (
+            session.query(DailyStats)
+            .filter(func.strftime("%w", DailyStats.Period) == str(weekday))
+            .order_by(DailyStats.Period.desc())
+        )
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        return rollups_to_df(query.all())
+
+@timed("db.count_weekday_stats")
+def count_weekday_stats(weekday=6):
+    with SessionLocal() as session:
+        return session.query(func.count()).filter(func.strftime("%w", DailyStats.Period) == str(weekday)).scalar()
+
+# Totals per week (labelled by its Monday), newest first
+@timed("db.weekly_stats")
+def weekly_stats(limit=None, offset=0):
+    with SessionLocal() as session:
+        query = session.query(WeeklyStats).order_by(WeeklyStats.Period.desc())
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        return rollups_to_df(query.all(), "week")
+
+@timed("db.count_weeks")
+def count_weeks():
+    with SessionLocal() as session:
+        return session.query(func.count(WeeklyStats.Period)).scalar()
+
+# Visits and people per zip between two dates (`end` exclusive), busiest first.
+# Households is left out: unique per day, it cannot be summed across days.
+@timed("db.zip_distribution")
+def zip_distribution(start=None, end=None):
+    import pandas as pd
+    metrics = ["Visits", "Individuals", "Children", "Walking", "Driving"]
+    with SessionLocal() as session:
+        query = session.query(DailyZipStats.Zip, *[func.sum(getattr(DailyZipStats, m)) for m in metrics])
+        if start:
+            query = query.filter(DailyZipStats.Period >= start)
+        if end:
+            query = query.filter(DailyZipStats.Period < end)
+        rows = query.group_by(DailyZipStats.Zip).order_by(func.sum(DailyZipStats.Visits).desc()).all()
+    return pd.DataFrame(
+        [list(row[1:]) for row in rows],
+        index=pd.Index([row[0] or "(none)" for row in rows], name="zip"),
+        columns=metrics,
+    )
+
+AGE_BRACKETS = [("Under 5", 0, 4), ("5-17", 5, 17), ("18-64", 18, 64), ("65+", 65, MAX_AGE)]
+
+def households_served(start=None, end=None):
+    return filter_visits(select(Visit.household_id), start, end)
+
+# People listed on intake forms by age bracket, for households that visited
+# between two dates (`end` exclusive). Households are counted once however
+# often they came.
+@timed("db.age_breakdown")
+def age_breakdown(start=None, end=None):
+    import pandas as pd
+    with SessionLocal() as session:
+        query = session.query(*[
+            func.coalesce(func.sum(case((HouseholdAge.Age.between(low, high), 1), else_=0)), 0)
+            for _, low, high in AGE_BRACKETS
+        ])
+        if start or end:
+            query = query.filter(HouseholdAge.household_id.in_(households_served(start, end)))
+        counts = query.one()
+    return pd.Series(counts, index=pd.Index([label for label, _, _ in AGE_BRACKETS], name="age"), dtype="int64")
+
+# Households with children at each school level, same date rules as age_breakdown
+@timed("db.school_level_breakdown")
+def school_level_breakdown(start=None, end=None):
+    import pandas as pd
+    with SessionLocal() as session:
+        query = session.query(HouseholdSchoolLevel.Level, func.count()).group_by(HouseholdSchoolLevel.Level)
+        if start or end:
+            query = query.filter(HouseholdSchoolLevel.household_id.in_(households_served(start, end)))
+        counts = dict(query.all())
+    return pd.Series([counts.get(level, 0) for level in SCHOOL_LEVELS], index=pd.Index(SCHOOL_LEVELS, name="school_level"), dtype="int64")
+
+@timed("db.get_data_version")
+def get_data_version():
+    with SessionLocal() as session:
+        return session.query(DataVersion.version).filter(DataVersion.id == 1).scalar()
+
+# Works with a Session or a Core connection, inside the caller's transaction
+def bump_data_version(session):
+    session.execute(update(DataVersion).where(DataVersion.id == 1).values(version=DataVersion.version + 1))
+
+CHECKED_IN, ALREADY_CHECKED_IN, NOT_FOUND = "checked_in", "already_checked_in", "not_found"
+
+# Returning-household check-in: one indexed phone lookup and one insert in a
+# single transaction. The insert is skipped on conflict with
+# uq_visits_household_date, so two tablets checking the same household in
+# at once record one visit. Returns CHECKED_IN, ALREADY_CHECKED_IN or NOT_FOUND.
+@timed("db.check_in")
+def check_in(phone, arrival_mode, timestamp=None):
+    phone_clean = normalize_phone(phone or "")
+    # Not a phone number: would match households migrated without one
+    if len(phone_clean) < 10:
+        return NOT_FOUND
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with WriteSession() as session:
+        household_id = session.execute(
+            select(Household.id).where(Household.Phone_clean == phone_clean).order_by(Household.id).limit(1)
+        ).scalar()
+        if household_id is None:
+            return NOT_FOUND
+        inserted = session.execute(
+            sqlite_insert(Visit)
+            .values(household_id=household_id, Timestamp=timestamp, Visit_Date=visit_date(timestamp), Arrival_Mode=arrival_mode)
+            .on_conflict_do_nothing(index_elements=["household_id", "Visit_Date"])
+        ).rowcount
+        if not inserted:
+            return ALREADY_CHECKED_IN
+        refresh_rollups(session, [timestamp])
+        bump_data_version(session)
+        session.commit()
+    return CHECKED_IN
+
+@timed("db.checked_in_today")
+def checked_in_today(phone, day=None):
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    phone_clean = normalize_phone(phone or "")
+    if len(phone_clean) < 10:
+        return False
+    with SessionLocal() as session:
+        return session.query(Visit.id).join(Household, Visit.household_id == Household.id).filter(
+            Household.Phone_clean == phone_clean, Visit.Visit_Date == day
+        ).first() is not None
+
+# Add one submission to an open session: reuse the household for this phone
+# or create it, then append the visit. The caller commits. A submission whose
+# Client_Id is already recorded is skipped, so retries are harmless.
+def add_submission(session, row_dict):
+    client_id = row_dict.get("Client_Id")
+    if client_id and session.query(Visit.id).filter(Visit.Client_Id == client_id).first():
+        return
+    phone_clean = normalize_phone(row_dict.get("Phone") or "")
+    household = session.query(Household).filter(Household.Phone_clean == phone_clean).first()
+    if household is None:
+        household = Household(Phone_clean=phone_clean)
+        for label, attr in HOUSEHOLD_FIELDS.items():
+            setattr(household, attr, row_dict.get(label))
+        session.add(household)
+        session.flush()
+        store_household_demographics(session, household)
+    session.add(Visit(
+        household_id=household.id,
+        Timestamp=row_dict.get("Timestamp"),
+        Arrival_Mode=row_dict.get("Arrival Mode"),
+        Client_Id=client_id,
+    ))
+
+# Commit several submissions in one transaction; raises on failure
+def write_submissions(row_dicts):
+    with WriteSession() as session:
+        for row_dict in row_dicts:
+            add_submission(session, row_dict)
+        refresh_rollups(session, [row_dict.get("Timestamp") for row_dict in row_dicts])
+        bump_data_version(session)
+        session.commit()
+
+# Returns True once the submission is committed, False if it failed
+@timed("db.save_submission")
+def save_submission(row_dict):
+    try:
+        write_submissions([row_dict])
+        return True
+    except Exception:
+        log.exception("Failed to save submission: %s", redact(row_dict))
+        return False
+
+# Admin delete by visit id; a household goes with its last visit
+@timed("db.delete_submission_by_id")
+def delete_submission_by_id(sub_id):
+    with WriteSession() as session:
+        visit = session.get(Visit, sub_id)
+        if visit:
+            household_id, timestamp = visit.household_id, visit.Timestamp
+            session.delete(visit)
+            session.flush()
+            # Its last visit gone, the household goes too, unless archived
+            # visits may still point at it
+            if archived_before(session) is None and session.query(Visit.id).filter(Visit.household_id == household_id).first() is None:
+                clear_demographics(session, [household_id])
+                session.query(Household).filter(Household.id == household_id).delete()
+            refresh_rollups(session, [timestamp])
+            bump_data_version(session)
+            session.commit()
+
+UPDATED, CONFLICT, INVALID_TIMESTAMP, INVALID_NUMBER = "updated", "conflict", "invalid_timestamp", "invalid_number"
+# Household attributes the rollup tables are built from
+ROLLUP_HOUSEHOLD_ATTRS = {"Household", "Male_Adults", "Female_Adults", "Number_of_Children", "Zip"}
+# Integer household columns; the admin form hands them over as free text
+COUNT_ATTRS = {"Household", "Male_Adults", "Female_Adults", "Number_of_Children"}
+
+def same_value(old, new):
+    # Form widgets hand back "" for NULL and strings for numbers
+    return ("" if old is None else str(old)) == ("" if new is None else str(new))
+
+# Update by visit id: visit fields go to the visit, the rest to its household.
+# Only fields that differ from the stored values are written. With
+# expected_version (from get_submission), the household update is a
+# compare-and-swap on Version, so an edit based on stale data is refused
+# instead of overwriting someone else's change. Returns UPDATED, CONFLICT,
+# NOT_FOUND, INVALID_TIMESTAMP (malformed, or in the archived period),
+# INVALID_NUMBER (a count that is not a whole number) or ALREADY_CHECKED_IN
+# (the new timestamp is on a day the household already visited).
+@timed("db.update_submission_by_id")
+def update_submission_by_id(sub_id, update_dict, expected_version=None):
+    with WriteSession() as session:
+        row = session.execute(
+            select(Visit, Household).join(Household, Visit.household_id == Household.id).where(Visit.id == sub_id)
+        ).first()
+        if row is None:
+            return NOT_FOUND
+        return apply_update(session, *row, update_dict, expected_version)
+
+# Same for a household with no visit to edit (all archived): visit fields are ignored
+@timed("db.update_household_by_id")
+def update_household_by_id(household_id, update_dict, expected_version=None):
+    with WriteSession() as session:
+        household = session.get(Household, household_id)
+        if household is None:
+            return NOT_FOUND
+        return apply_update(session, None, household, update_dict, expected_version)
+
+# Shared body of the two updates, inside the caller's WriteSession; commits
+def apply_update(session, visit, household, update_dict, expected_version):
+    version = household.Version if expected_version is None else expected_version
+    if household.Version != version:
+        return CONFLICT
+    visit_changes = {
+        VISIT_FIELDS[key]: value for key, value in update_dict.items()
+        if visit and key in VISIT_FIELDS and not same_value(getattr(visit, VISIT_FIELDS[key]), value)
+    }
+    household_changes = {
+        HOUSEHOLD_FIELDS[key]: value for key, value in update_dict.items()
+        if key in HOUSEHOLD_FIELDS and not same_value(getattr(household, HOUSEHOLD_FIELDS[key]), value)
+    }
+    if not visit_changes and not household_changes:
+        return UPDATED
+    for attr in COUNT_ATTRS & household_changes.keys():
+        value = household_changes[attr]
+        if value in (None, ""):
+            household_changes[attr] = None
+        elif str(value).strip().isdigit():
+            household_changes[attr] = int(value)
+        else:
+            return INVALID_NUMBER
+
+    # Rollup buckets to recompute: the visit's old and new day, and every
+    # day this household visited if its counts or zip changed
+    affected = [visit.Timestamp] if visit else []
+    if ROLLUP_HOUSEHOLD_ATTRS & household_changes.keys():
+        affected += [ts for ts, in session.query(Visit.Timestamp).filter(Visit.household_id == household.id)]
+    if "Phone" in household_changes:
+        household_changes["Phone_clean"] = normalize_phone(household_changes["Phone"] or "")
+    if "Name" in household_changes:
+        household_changes["Name_Key"] = name_key(household_changes["Name"])
+    if "Timestamp" in visit_changes:
+        timestamp = visit_changes["Timestamp"]
+        if not is_timestamp(timestamp) or timestamp[:10] < (archived_before(session) or ""):
+            return INVALID_TIMESTAMP
+        visit_changes["Visit_Date"] = visit_date(timestamp)
+
+    # The version bump goes in every time, so visit-only edits conflict too
+    swapped = session.execute(
+        update(Household)
+        .where(Household.id == household.id, Household.Version == version)
+        .values(**household_changes, Version=Household.Version + 1)
+    ).rowcount
+    if not swapped:
+        session.rollback()
+        return CONFLICT
+    if visit_changes:
+        try:
+            session.execute(update(Visit).where(Visit.id == visit.id).values(**visit_changes))
+        except IntegrityError:
+            # uq_visits_household_date: one visit per household per day
+            session.rollback()
+            return ALREADY_CHECKED_IN
+    if DEMOGRAPHIC_ATTRS & household_changes.keys():
+        store_household_demographics(session, household)
+    refresh_rollups(session, affected + [visit_changes.get("Timestamp")])
+    bump_data_version(session)
+    session.commit()
+    return UPDATED
+
+@timed("db.is_duplicate")
+def is_duplicate(phone, email):
+    if phone_exists(phone):
+        return True
+    if not email:
+        return False
+    with SessionLocal() as session:
+        return session.query(Household.id).filter(Household.Email == email).first() is not None
@@ -0,0 +1,145 @@
+"""Fuzzy detection of households registered more than once.
+
+Candidates are blocked on (Zip, Name_Key), the soundex of the family name,
+through ix_households_zip_name_key. Only households in the same block are
+compared, so the cost grows with block sizes rather than with the square of
+the table. Each candidate pair is scored on name, email, phone and
+household composition; names and emails with difflib. Used for every new submission
+(find_duplicate_candidates) and as a batch job over the whole table:
+
+    python duplicates.py --out possible_duplicates.csv
+    python duplicates.py --threshold 0.9
+"""
+import argparse
+import csv
+import sys
+from difflib import SequenceMatcher
+from itertools import combinations, groupby
+from sqlalchemy import func, or_, select
+from database import HOUSEHOLD_FIELDS, Household, SessionLocal, init_db, name_key, normalize_phone
+from instrumentation import configure_logging, log, span, timed
+
+DUPLICATE_THRESHOLD = 0.75
+COMPOSITION_ATTRS = ["Household", "Male_Adults", "Female_Adults", "Number_of_Children"]
+# Blocks bigger than this are still compared, but logged: the key is too coarse there
+LARGE_BLOCK = 500
+SCAN_CHUNK = 5000
+
+def text_similarity(a, b):
+    a, b = " ".join(str(a or "").lower().split()), " ".join(str(b or "").lower().split())
+    if not a or not b:
+        return None
+    return SequenceMatcher(None, a, b).ratio()
+
+# Share of matching digit positions: a mistyped digit still scores 0.9
+def phone_similarity(a, b):
+    a, b = normalize_phone(a or "")[-10:], normalize_phone(b or "")[-10:]
+    if not a or not b:
+        return None
+    return sum(x == y for x, y in zip(a, b)) / max(len(a), len(b))
+
+# A stored count as an int, or None if missing or not a whole number
+def as_count(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def composition_similarity(a, b):
+    pairs = [(as_count(a.get(attr)), as_count(b.get(attr))) for attr in COMPOSITION_ATTRS]
+    pairs = [(x, y) for x, y in pairs if x is not None and y is not None]
+    if not pairs:
+        return None
+    return sum(x == y for x, y in pairs) / len(pairs)
+
+# (signal, weight, similarity function), cheapest and most telling first.
+# A signal missing on either side is left out of the weighted average.
+SIGNALS = [
+    ("name", 0.5, lambda a, b: text_similarity(a.get("Name"), b.get("Name"))),
+    ("household", 0.15, composition_similarity),
+    ("phone", 0.15, lambda a, b: phone_similarity(a.get("Phone"), b.get("Phone"))),
+    ("email", 0.2, lambda a, b: text_similarity(a.get("Email"), b.get("Email"))),
+]
+
+# 0..1 likelihood that two households ({attribute: value} dicts) are the same
+# family. With a floor, returns 0.0 as soon as the score can no longer reach it.
+def duplicate_score(a, b, floor=0.0):
+    total = weight = 0.0
+    remaining = sum(w for _, w, _ in SIGNALS)
+    for signal, w, similarity in SIGNALS:
+        remaining -= w
+        value = similarity(a, b)
+        if value is None:
+            if signal == "name":
+                return 0.0
+            continue
+        total += w * value
+        weight += w
+        # Best case: every signal still to come matches perfectly
+        if floor and (total + remaining) / (weight + remaining) < floor:
+            return 0.0
+    return total / weight
+
+def household_dict(household):
+    return {attr: getattr(household, attr) for attr in ["id", "Name_Key", *HOUSEHOLD_FIELDS.values()]}
+
+# Households on file that look like the submission (a row_dict keyed by
+# column label), best match first. One indexed range read of its block.
+@timed("duplicates.check")
+def find_duplicate_candidates(row_dict, threshold=DUPLICATE_THRESHOLD, limit=5):
+    key = name_key(row_dict.get("Name"))
+    if not key:
+        return []
+    new = {attr: row_dict.get(label) for label, attr in HOUSEHOLD_FIELDS.items()}
+    zip_code = row_dict.get("Zip")
+    same_zip = Household.Zip == zip_code if zip_code else or_(Household.Zip.is_(None), Household.Zip == "")
+    with SessionLocal() as session:
+        block = session.execute(
+            select(Household).where(same_zip, Household.Name_Key == key)
+        ).scalars().all()
+    candidates = [(duplicate_score(new, household_dict(h), threshold), household_dict(h)) for h in block]
+    candidates = sorted((c for c in candidates if c[0] >= threshold), key=lambda c: -c[0])
+    return [dict(household, Score=round(score, 3)) for score, household in candidates[:limit]]
+
+# Every (household a, household b, score) pair above the threshold. Streams
+# households in (Zip, Name_Key) order and compares within each block; no zip
+# and an empty zip are one block.
+def find_duplicate_pairs(threshold=DUPLICATE_THRESHOLD):
+    stmt = (
+        select(Household)
+        .where(Household.Name_Key.isnot(None))
+        .order_by(func.coalesce(Household.Zip, ""), Household.Name_Key, Household.id)
+        .execution_options(yield_per=SCAN_CHUNK)
+    )
+    with SessionLocal() as session:
+        households = (household_dict(h) for h in session.execute(stmt).scalars())
+        for (zip_code, key), block in groupby(households, key=lambda h: (h["Zip"] or "", h["Name_Key"])):
+            block = list(block)
+            if len(block) > LARGE_BLOCK:
+                log.warning("Large duplicate block: zip %s, key %s, %d households", zip_code, key, len(block))
+            with span("duplicates.block"):
+                scored = [(a, b, duplicate_score(a, b, threshold)) for a, b in combinations(block, 2)]
+            yield from (pair for pair in scored if pair[2] >= threshold)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find households that may be registered twice.")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD)
+    parser.add_argument("--out", help="write pairs as CSV here (default: stdout)")
+    args = parser.parse_args(argv)
+    configure_logging()
+    init_db()
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["score", "id_a", "id_b", "name_a", "name_b", "zip", "phone_a", "phone_b", "email_a", "email_b"])
+        count = 0
+        for a, b, score in find_duplicate_pairs(args.threshold):
+            writer.writerow([round(score, 3), a["id"], b["id"], a["Name"], b["Name"], a["Zip"], a["Phone"], b["Phone"], a["Email"], b["Email"]])
+            count += 1
+    finally:
+        if args.out:
+            out.close()
+    print(f"{count} possible duplicate pairs", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Stream submissions out of SQLite as CSV or Parquet.
+
+Rows are read in chunks with yield_per, so memory stays flat no matter how
+long the visit history is. Usable from the admin page or on its own:
+
+    python export_submissions.py --out submissions.csv
+    python export_submissions.py --format parquet --out march.parquet --start 2025-03-01 --end 2025-04-01
+    python export_submissions.py --since-last --out nightly.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import select
+from database import COLUMNS, SessionLocal, Household, Visit, filter_visits, init_db
+
+EXPORT_CHUNK_SIZE = 1000
+# Remembers the last exported visit id for --since-last
+EXPORT_STATE_FILE = "export_state.json"
+
+# (column label, model attribute) in CSV order, visit id first
+EXPORT_FIELDS = [
+    ("Timestamp", Visit.Timestamp),
+    ("Household", Household.Household),
+    ("Male Adults", Household.Male_Adults),
+    ("Male Ages", Household.Male_Ages),
+    ("Female Adults", Household.Female_Adults),
+    ("Female Ages", Household.Female_Ages),
+    ("Number of Children", Household.Number_of_Children),
+    ("Kids Ages", Household.Kids_Ages),
+    ("School Levels", Household.School_Levels),
+    ("Zip", Household.Zip),
+    ("Referral", Household.Referral),
+    ("Phone", Household.Phone),
+    ("Email", Household.Email),
+    ("Name", Household.Name),
+    ("Arrival Mode", Visit.Arrival_Mode),
+]
+assert [label for label, _ in EXPORT_FIELDS] == COLUMNS
+
+# Yield (visit id, row tuple) pairs in visit id order, one chunk in memory at a time
+def iter_submission_rows(start=None, end=None, after_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    stmt = (
+        select(Visit.id, *[attr for _, attr in EXPORT_FIELDS])
+        .join(Household, Visit.household_id == Household.id)
+        .order_by(Visit.id)
+    )
+    stmt = filter_visits(stmt, start, end)
+    if after_id is not None:
+        stmt = stmt.where(Visit.id > after_id)
+    with SessionLocal() as session:
+        for row in session.execute(stmt.execution_options(yield_per=chunk_size)):
+            yield row[0], tuple(row[1:])
+
+# Write rows to a text file object; returns (rows written, last visit id)
+def write_csv(fileobj, rows):
+    writer = csv.writer(fileobj)
+    writer.writerow(COLUMNS)
+    count, last_id = 0, None
+    for last_id, row in rows:
+        writer.writerow(row)
+        count += 1
+    return count, last_id
+
+def write_parquet(path, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = pa.schema([(label, pa.string()) for label in COLUMNS])
+    count, last_id, batch = 0, None, []
+
+    def flush(writer):
+        columns = list(zip(*batch))
+        writer.write_batch(pa.record_batch(
+            [pa.array([None if v is None else str(v) for v in col], pa.string()) for col in columns],
+            schema=schema,
+        ))
+        batch.clear()
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for last_id, row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= chunk_size:
+                flush(writer)
+        if batch:
+            flush(writer)
+    return count, last_id
+
+def read_export_state(state_file=EXPORT_STATE_FILE):
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+def write_export_state(state, state_file=EXPORT_STATE_FILE):
+    with open(state_file, "w") as f:
+        json.dump(state, f)
+
+# Export to `out` (path); with since_last, only visits added after the previous since_last export
+def export_submissions(out, fmt="csv", start=None, end=None, since_last=False, state_file=EXPORT_STATE_FILE):
+    after_id = read_export_state(state_file).get("last_id") if since_last else None
+    rows = iter_submission_rows(start, end, after_id)
+    if fmt == "parquet":
+        count, last_id = write_parquet(out, rows)
+    else:
+        with open(out, "w", newline="") as f:
+            count, last_id = write_csv(f, rows)
+    if since_last and last_id is not None:
+        write_export_state({"last_id": last_id, "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, state_file)
+    return count
+
+# For st.download_button: stream to a temp file instead of building a DataFrame
+def export_csv_bytes(start=None, end=None):
+    with tempfile.TemporaryFile(mode="w+b") as tmp:
+        text_out = io.TextIOWrapper(tmp, encoding="utf-8", newline="")
+        write_csv(text_out, iter_submission_rows(start, end))
+        text_out.flush()
+        tmp.seek(0)
+        data = tmp.read()
+        text_out.detach()
+    return data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export food bank submissions.")
+    parser.add_argument("--out", required=True, help="output file path")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--start", help="first day to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="day to stop before (YYYY-MM-DD, exclusive)")
+    parser.add_argument("--since-last", action="store_true", help="only visits added since the last --since-last export")
+    parser.add_argument("--state-file", default=EXPORT_STATE_FILE)
+    args = parser.parse_args(argv)
+    init_db()
+    count = export_submissions(args.out, args.format, args.start, args.end, args.since_last, args.state_file)
+    print(f"Exported {count} submissions to {args.out}")
+
+if __name__ == "__main__":
+    main()
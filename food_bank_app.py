@@ -1,151 +1,24 @@
 import streamlit as st
-import pandas as pd
-import re
-from datetime import datetime
-import os
-from sqlalchemy import create_engine, Column, String, Integer, DateTime
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
-
-DB_FILE = "submissions.db"
-COLUMNS = [
-    "Timestamp", "Household", "Male Adults", "Male Ages", "Female Adults", "Female Ages",
-    "Number of Children", "Kids Ages", "School Levels", "Zip", "Referral", "Phone", "Email", "Name", "Arrival Mode"
-]
-
-# SQLAlchemy setup (declarative)
-Base = declarative_base()
-engine = create_engine(f"sqlite:///{DB_FILE}", echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
-
-# Submission model
-class Submission(Base):
-    __tablename__ = "submissions"
-    id = Column(Integer, primary_key=True, index=True)
-    Timestamp = Column(String)
-    Household = Column(Integer)
-    Male_Adults = Column(Integer)
-    Male_Ages = Column(String)
-    Female_Adults = Column(Integer)
-    Female_Ages = Column(String)
-    Number_of_Children = Column(Integer)
-    Kids_Ages = Column(String)
-    School_Levels = Column(String)
-    Zip = Column(String)
-    Referral = Column(String)
-    Phone = Column(String)
-    Email = Column(String)
-    Name = Column(String)
-    Arrival_Mode = Column(String)
-
-# Create table if missing
-Base.metadata.create_all(bind=engine)
-
-# Context-managed session utility
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-# Database setup
-engine = create_engine(f"sqlite:///{DB_FILE}", echo=False)
-
-def normalize_phone(phone):
-    return ''.join(filter(str.isdigit, str(phone)))
-
-def validate_inputs(phone, email, zip_code):
-    errors = []
-    if not phone or len(normalize_phone(phone)) < 10:
-        errors.append("Please enter a valid phone number.")
-    if email and "@" not in email:
-        errors.append("Please enter a valid email address.")
-    if zip_code and (not zip_code.isdigit() or len(zip_code) != 5):
-        errors.append("Please enter a valid 5-digit zip code.")
-    return errors
-
-def load_submissions():
-    with SessionLocal() as session:
-        submissions = session.query(Submission).all()
-        if submissions:
-            # Convert to DataFrame
-            df = pd.DataFrame([
-                {
-                    "Timestamp": s.Timestamp,
-                    "Household": s.Household,
-                    "Male Adults": s.Male_Adults,
-                    "Male Ages": s.Male_Ages,
-                    "Female Adults": s.Female_Adults,
-                    "Female Ages": s.Female_Ages,
-                    "Number of Children": s.Number_of_Children,
-                    "Kids Ages": s.Kids_Ages,
-                    "School Levels": s.School_Levels,
-                    "Zip": s.Zip,
-                    "Referral": s.Referral,
-                    "Phone": s.Phone,
-                    "Email": s.Email,
-                    "Name": s.Name,
-                    "Arrival Mode": s.Arrival_Mode
-                }
-                for s in submissions
-            ])
-            return df
-        else:
-            return pd.DataFrame(columns=COLUMNS)
-
-def save_submission(row_dict):
-    try:
-        with SessionLocal() as session:
-            submission = Submission(
-                Timestamp=row_dict.get("Timestamp"),
-                Household=row_dict.get("Household"),
-                Male_Adults=row_dict.get("Male Adults"),
-                Male_Ages=row_dict.get("Male Ages"),
-                Female_Adults=row_dict.get("Female Adults"),
-                Female_Ages=row_dict.get("Female Ages"),
-                Number_of_Children=row_dict.get("Number of Children"),
-                Kids_Ages=row_dict.get("Kids Ages"),
-                School_Levels=row_dict.get("School Levels"),
-                Zip=row_dict.get("Zip"),
-                Referral=row_dict.get("Referral"),
-                Phone=row_dict.get("Phone"),
-                Email=row_dict.get("Email"),
-                Name=row_dict.get("Name"),
-                Arrival_Mode=row_dict.get("Arrival Mode")
-            )
-            session.add(submission)
-            session.commit()
-        print(f"DEBUG: Submission saved to database: {row_dict}")
-    except Exception as e:
-        print(f"ERROR: Failed to save submission: {row_dict}")
-        print(f"ERROR: Exception: {e}")
-        import traceback
-        traceback.print_exc()
-
-# Admin delete by id
-def delete_submission_by_id(sub_id):
-    with SessionLocal() as session:
-        obj = session.query(Submission).filter(Submission.id == sub_id).first()
-        if obj:
-            session.delete(obj)
-            session.commit()
-
-# Admin update by id
-def update_submission_by_id(sub_id, update_dict):
-    with SessionLocal() as session:
-        obj = session.query(Submission).filter(Submission.id == sub_id).first()
-        if obj:
-            for key, value in update_dict.items():
-                # Map keys to model attributes
-                attr = key.replace(" ", "_").replace("-", "_")
-                if hasattr(obj, attr):
-                    setattr(obj, attr, value)
-            session.commit()
-
-    # ...existing code...
-    # Remove duplicate/invalid validation code
-
-def is_duplicate(df, phone, email):
-    return not df[(df["Phone"] == phone) | (df["Email"] == email)].empty
+import importlib
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+import database
+from database import (
+    COLUMNS, PAGE_SIZE, validate_inputs, submissions_to_df, get_data_version,
+    find_submissions_by_phone, phone_exists, is_duplicate,
+    next_day, count_submissions, query_submissions,
+    daily_visit_count, weekday_stats, count_weekday_stats, weekly_stats, count_weeks, zip_distribution,
+    age_breakdown, school_level_breakdown,
+    count_search_results, search_submissions,
+    CHECKED_IN, ALREADY_CHECKED_IN, checked_in_today, delete_submission_by_id,
+    UPDATED, CONFLICT, NOT_FOUND, INVALID_TIMESTAMP, INVALID_NUMBER, get_submission, update_submission_by_id,
+    get_household_by_phone, update_household_by_id,
+)
+from write_queue import QUEUED, submit_check_in, submit_submission
+from duplicates import find_duplicate_candidates, find_duplicate_pairs
+from outbox import OUTBOX_ENABLED, PENDING, FAILED, get_outbox
+from instrumentation import configure_logging, increment, log, span, start_metrics_server
 
 def reset_form():
     reset_values = {
@@ -154,61 +27,113 @@ def reset_form():
     }
     for key, value in reset_values.items():
         st.session_state[key] = value
+    clear_duplicate_check()
     del st.session_state["reset_form"]
 
+# Forget the possible duplicates shown for an earlier phone and name, and the
+# "save it anyway" answer given for them
+def clear_duplicate_check():
+    for key in ("possible_duplicates", "duplicates_for", "confirm_new_household"):
+        st.session_state.pop(key, None)
+
 def normalize_phone(phone):
     # Remove all non-digit characters
     return ''.join(filter(str.isdigit, str(phone)))
 
 
+# ------------------ Cached reads ------------------
+# Streamlit reruns this whole script on every widget interaction. Query
+# results are cached keyed on the database write counter, so reruns reuse
+# them until a save, update or delete actually changes the data.
+
+@st.cache_data(show_spinner=False, max_entries=500)
+def cached_query(module_name, query_name, version, *args):
+    # Only runs on a cache miss; hit rate = 1 - misses / requests
+    increment("cache_misses", query=query_name)
+    return getattr(importlib.import_module(module_name), query_name)(*args)
+
+def read(query, *args):
+    increment("cache_requests", query=query.__name__)
+    return cached_query(query.__module__, query.__name__, get_data_version(), *args)
+
+# A check against the main database that intake can do without: with the
+# outbox, returns `default` while the main database is unavailable
+def unless_offline(default, fn, *args):
+    try:
+        return fn(*args)
+    except OperationalError as e:
+        if not OUTBOX_ENABLED:
+            raise
+        name = (args[0] if fn is read else fn).__name__
+        log.warning("Main database unavailable, skipping %s: %s", name, getattr(e, "orig", e))
+        return default
+
 # ------------------ UI Sections ------------------
 
 def show_privacy_notice():
     st.info("Your information is kept confidential and used only for food bank intake purposes. Thank you for serving with care.")
 
-def show_lookup_section(df):
+def show_lookup_section():
     st.markdown("## 🔍 Lookup Existing Submission")
     phone = st.text_input("Enter phone number (e.g. 555-555-5000 or 5555555000)")
-    phone_clean = normalize_phone(phone)
-    df["Phone_clean"] = df["Phone"].astype(str).apply(normalize_phone)
-    match = df[df["Phone_clean"] == phone_clean]
-    if not match.empty:
+    match = read(find_submissions_by_phone, phone) if phone else None
+    # Every visit archived: the household is still on file and can check in
+    household = read(get_household_by_phone, phone) if match is not None and match.empty else None
+    if match is not None and (not match.empty or household):
         st.success("Match found:")
-        st.write(match.drop(columns=["Phone_clean"]))
-        st.info(f"Total submissions for this contact: {match.shape[0]}")
-        today = datetime.now().strftime('%Y-%m-%d')
-        already_submitted = match[match["Timestamp"].str.startswith(today)]
-        if already_submitted.empty:
+        if household:
+            st.dataframe([household[1]])
+            st.info("Earlier visits for this contact are in the archive.")
+        else:
+            st.write(match)
+            st.info(f"Total submissions for this contact: {match.shape[0]}")
+        # Today's date is part of the cache key, so yesterday's answer is never reused
+        if not read(checked_in_today, phone, datetime.now().strftime('%Y-%m-%d')):
             arrival_mode = st.radio("How did you arrive today?", ["Walking", "Driving"], key="lookup_arrival_mode")
             if st.button("Log Submission for Today"):
-                new_record = match.iloc[-1].copy()
-                new_record["Timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                new_record["Arrival Mode"] = arrival_mode
-                df_new = pd.DataFrame([new_record.drop(labels=["Phone_clean"])]).reset_index(drop=True)
-                # Save new submission to database
-                # Save new submission to database
-                save_submission(df_new.iloc[0].to_dict())
-                st.success("Submission logged for today!")
-                st.experimental_rerun()
+                # Household details are already on file; only the visit is new
+                show_check_in_result(phone, submit_check_in(phone, arrival_mode))
         else:
             st.warning("Submission for today already logged for this contact.")
+        if match.empty:
+            return
         # Option to remove submission by admin
         st.markdown("---")
         st.markdown("### Remove a Submission (Admin Only)")
-        remove_index = st.number_input("Enter row index to remove (see leftmost column above)", min_value=0, max_value=len(match)-1, step=1)
+        remove_id = st.selectbox("Submission to remove (id, leftmost column above)", match.index.tolist(), key="remove_id")
         remove_pw = st.text_input("Admin password to remove", type="password", key="remove_pw")
         if st.button("Remove Submission"):
             if remove_pw == "light2025":
-                global_index = match.index[remove_index]
-                # Remove from database: not implemented in SQLite version (admin delete can be added later)
-                st.success(f"Submission at index {remove_index} removed (refresh to see changes).")
-                st.experimental_rerun()
+                delete_submission_by_id(int(remove_id))
+                st.success(f"Submission {remove_id} removed.")
+                st.rerun()
             else:
                 st.error("Incorrect admin password.")
     elif phone:
         st.warning("No match found for that contact number.")
 
-def show_submission_form(df):
+# Returning households on a busy day: no tables loaded, one lookup and one insert
+def show_quick_check_in():
+    st.markdown("## ✅ Quick Check-In")
+    st.caption("For households already on file. New households use New Submission.")
+    with st.form("check_in_form", clear_on_submit=True):
+        phone = st.text_input("Phone number", key="check_in_phone")
+        arrival_mode = st.radio("How did you arrive today?", ["Walking", "Driving"], horizontal=True, key="check_in_arrival_mode")
+        submitted = st.form_submit_button("Check In")
+    if submitted and phone:
+        show_check_in_result(phone, submit_check_in(phone, arrival_mode))
+
+def show_check_in_result(phone, result):
+    if result == CHECKED_IN:
+        st.success(f"Checked in {phone}.")
+    elif result == QUEUED:
+        st.success(f"Checked in {phone}. Saved on this device; it syncs when the main database is back.")
+    elif result == ALREADY_CHECKED_IN:
+        st.warning(f"{phone} is already checked in today.")
+    else:
+        st.error("No household found for that phone number. Please use New Submission.")
+
+def show_submission_form():
     st.markdown("## 📝 New Intake Submission")
     with st.form("intake_form"):
         phone = st.text_input("Contact number (e.g. 555-555-1234)", key="intake_phone")
@@ -226,23 +151,29 @@ def show_submission_form(df):
         referral = st.text_input("How did you hear about us?", key="referral")
         arrival_mode = st.radio("How did you arrive today?", ["Walking", "Driving"], key="arrival_mode")
 
+        # Shown after a submit that looked like a household already on file,
+        # as long as the phone and name are still the ones that were checked
+        checked_for = (normalize_phone(phone), name.strip().lower())
+        if st.session_state.get("duplicates_for") != checked_for:
+            clear_duplicate_check()
+        possible_duplicates = st.session_state.get("possible_duplicates")
+        confirm_new = False
+        if possible_duplicates:
+            st.warning("This looks like a household that is already registered. If it is, please use Lookup or Quick Check-In instead.")
+            st.table(possible_duplicates)
+            confirm_new = st.checkbox("This is a different household; save it anyway", key="confirm_new_household")
+
         submitted = st.form_submit_button("Submit")
 
         if submitted:
-            print("DEBUG: Submitted form values:")
-            print(f"phone={phone}, email={email}, name={name}, household={household}, male_adults={male_adults}, male_ages={male_ages}, female_adults={female_adults}, female_ages={female_ages}, number_of_children={number_of_children}, kids_ages={kids_ages}, school_levels={school_levels}, zip_code={zip_code}, referral={referral}, arrival_mode={arrival_mode}")
             # Check if phone already exists
-            phone_clean = normalize_phone(phone)
-            df["Phone_clean"] = df["Phone"].apply(normalize_phone)
-            already_exists = not df[df["Phone_clean"] == phone_clean].empty
-            print(f"DEBUG: already_exists={already_exists}")
+            already_exists = unless_offline(False, read, phone_exists, phone)
             if already_exists:
                 st.warning("This phone number already exists in the records. Please use the Lookup section to log a submission.")
-                st.write(df[df["Phone_clean"] == phone_clean].drop(columns=["Phone_clean"]))
+                st.write(read(find_submissions_by_phone, phone))
                 st.stop()
 
             errors = validate_inputs(phone, email, zip_code)
-            print(f"DEBUG: errors={errors}")
             if errors:
                 for err in errors:
                     st.error(err)
@@ -264,195 +195,277 @@ def show_submission_form(df):
                 "Phone": phone,
                 "Email": email,
                 "Name": name,
-                "Arrival Mode": arrival_mode
+                "Arrival Mode": arrival_mode,
+                # Same id if this form is submitted again, so it is only recorded once
+                "Client_Id": st.session_state.setdefault("intake_client_id", str(uuid.uuid4())),
             }
-            print(f"DEBUG: row_dict={row_dict}")
-            save_submission(row_dict)
+            # Same family under a new phone or a mistyped email?
+            if not confirm_new:
+                candidates = unless_offline([], find_duplicate_candidates, row_dict)
+                if candidates:
+                    st.session_state["possible_duplicates"] = [
+                        {"Name": c["Name"], "Zip": c["Zip"], "Phone": c["Phone"], "Email": c["Email"],
+                         "Household": c["Household"], "Match": c["Score"]}
+                        for c in candidates
+                    ]
+                    st.session_state["duplicates_for"] = checked_for
+                    st.rerun()
+
+            if not submit_submission(row_dict):
+                st.error("The submission could not be saved. Please try again.")
+                return
+            del st.session_state["intake_client_id"]
+            clear_duplicate_check()
             st.success("Submission saved!")
 
             if "reset_form" not in st.session_state:
                 st.session_state["reset_form"] = True
                 st.rerun()
 
-def show_update_section(df):
+# Messages for update_submission_by_id results other than UPDATED
+UPDATE_FAILURES = {
+    CONFLICT: "Someone else changed this household while you were editing. Find it again to see the latest details.",
+    NOT_FOUND: "This submission no longer exists.",
+    INVALID_TIMESTAMP: "Timestamp must look like 2025-01-31 10:00:00 and cannot be in the archived period.",
+    INVALID_NUMBER: "Household, Male Adults, Female Adults and Number of Children must be whole numbers.",
+    ALREADY_CHECKED_IN: "This household already has a visit on that day.",
+}
+
+def show_update_section():
     st.markdown("## ✏️ Update Existing Submission")
     with st.form("update_lookup"):
         phone = st.text_input("Enter contact number to update", placeholder="e.g. 555-555-1234")
         find = st.form_submit_button("Find Submission")
 
     if find:
-        match = df[df["Phone"] == phone]
-        if match.empty:
-            st.warning("No submission found for that contact number.")
-            return
+        match = read(find_submissions_by_phone, phone)
+        # Keep the visit id and the household version the form was filled
+        # from; the form's submit is a later rerun
+        if not match.empty:
+            sub_id = int(match.index[0])
+            row, version = get_submission(sub_id)
+            st.session_state["update_target"] = {"id": sub_id, "version": version, "row": row}
+        else:
+            # Every visit archived: only the household details can be edited
+            household = get_household_by_phone(phone)
+            if household is None:
+                st.session_state.pop("update_target", None)
+                st.warning("No submission found for that contact number.")
+                return
+            household_id, row, version = household
+            st.session_state["update_target"] = {"id": None, "household_id": household_id, "version": version, "row": row}
+
+    target = st.session_state.get("update_target")
+    if not target:
+        return
+    row = target["row"]
+    st.success("Submission found. You can now edit the fields below.")
+
+    with st.form("update_form"):
+        household = st.number_input("Household", value=int(row["Household"] or 1), min_value=1)
+        male_adults = st.number_input("Male Adults", value=int(row["Male Adults"] or 0), min_value=0)
+        male_ages = st.text_input("Male Ages", value=row["Male Ages"] or "")
+        female_adults = st.number_input("Female Adults", value=int(row["Female Adults"] or 0), min_value=0)
+        female_ages = st.text_input("Female Ages", value=row["Female Ages"] or "")
+        kids_ages = st.text_input("Kids Ages", value=row["Kids Ages"] or "")
+        school_levels = st.text_input("School Levels", value=row["School Levels"] or "")
+        zip_code = st.text_input("Zip", value=row["Zip"] or "")
+        referral = st.text_input("Referral", value=row["Referral"] or "")
+        phone = st.text_input("Phone", value=row["Phone"] or "")
+        email = st.text_input("Email", value=row["Email"] or "")
+        name = st.text_input("Name and Last Name (optional)", value=row["Name"] or "")
+        arrival_mode = st.text_input("Arrival Mode", value=row["Arrival Mode"] or "", disabled=target["id"] is None)
+        confirm = st.checkbox("I confirm I want to update this submission.")
+        update = st.form_submit_button("Update Submission")
+
+        if update and confirm:
+            errors = validate_inputs(phone, email, zip_code)
+            if errors:
+                for err in errors:
+                    st.error(err)
+                return
+
+            # Prevent duplicate phone/email on update
+            if (phone != row["Phone"] or email != row["Email"]) and is_duplicate(phone, email):
+                st.warning("A submission with this phone or email already exists.")
+                return
 
-        index = match.index[0]
-        st.success("Submission found. You can now edit the fields below.")
-
-        with st.form("update_form"):
-            household = st.number_input("Household", value=int(match.at[index, "Household"]), min_value=1)
-            male_adults = st.number_input("Male Adults", value=int(match.at[index, "Male Adults"]), min_value=0)
-            male_ages = st.text_input("Male Ages", value=match.at[index, "Male Ages"])
-            female_adults = st.number_input("Female Adults", value=int(match.at[index, "Female Adults"]), min_value=0)
-            female_ages = st.text_input("Female Ages", value=match.at[index, "Female Ages"])
-            kids_ages = st.text_input("Kids Ages", value=match.at[index, "Kids Ages"])
-            school_levels = st.text_input("School Levels", value=match.at[index, "School Levels"])
-            zip_code = st.text_input("Zip", value=match.at[index, "Zip"])
-            referral = st.text_input("Referral", value=match.at[index, "Referral"])
-            phone = st.text_input("Phone", value=match.at[index, "Phone"])
-            email = st.text_input("Email", value=match.at[index, "Email"])
-            name = st.text_input("Name and Last Name (optional)", value=match.at[index, "Name"] if "Name" in match.columns else "")
-            arrival_mode = st.text_input("Arrival Mode", value=match.at[index, "Arrival Mode"] if "Arrival Mode" in match.columns else "")
-            confirm = st.checkbox("I confirm I want to update this submission.")
-            update = st.form_submit_button("Update Submission")
-
-            if update and confirm:
-                errors = validate_inputs(phone, email, zip_code)
-                if errors:
-                    for err in errors:
-                        st.error(err)
-                    return
-
-                # Prevent duplicate phone/email on update
-                if (phone != match.at[index, "Phone"] or email != match.at[index, "Email"]) and is_duplicate(df, phone, email):
-                    st.warning("A submission with this phone or email already exists.")
-                    return
-
-                # Update in database
-                sub_id = match.index[0] + 1  # SQLite id is index+1
-                update_dict = {
-                    "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "Household": household,
-                    "Male Adults": male_adults,
-                    "Male Ages": male_ages,
-                    "Female Adults": female_adults,
-                    "Female Ages": female_ages,
-                    "Number of Children": match.at[index, "Number of Children"] if "Number of Children" in match.columns else 0,
-                    "Kids Ages": kids_ages,
-                    "School Levels": school_levels,
-                    "Zip": zip_code,
-                    "Referral": referral,
-                    "Phone": phone,
-                    "Email": email,
-                    "Name": name,
-                    "Arrival Mode": arrival_mode
-                }
-                update_submission_by_id(sub_id, update_dict)
-                st.success(f"Submission for {phone} updated successfully! (refresh to see changes)")
-            elif update and not confirm:
-                st.warning("Please confirm before updating.")
-
-def show_admin_download(df):
+            # Only fields that differ from the stored row are written
+            update_dict = {
+                "Household": household,
+                "Male Adults": male_adults,
+                "Male Ages": male_ages,
+                "Female Adults": female_adults,
+                "Female Ages": female_ages,
+                "Kids Ages": kids_ages,
+                "School Levels": school_levels,
+                "Zip": zip_code,
+                "Referral": referral,
+                "Phone": phone,
+                "Email": email,
+                "Name": name,
+                "Arrival Mode": arrival_mode
+            }
+            if target["id"] is None:
+                result = update_household_by_id(target["household_id"], update_dict, expected_version=target["version"])
+            else:
+                result = update_submission_by_id(target["id"], update_dict, expected_version=target["version"])
+            del st.session_state["update_target"]
+            if result == UPDATED:
+                st.success(f"Submission for {phone} updated successfully!")
+            else:
+                st.error(UPDATE_FAILURES[result])
+        elif update and not confirm:
+            st.warning("Please confirm before updating.")
+
+# Page number input plus one page of rows; returns the page's offset
+def page_offset(total, key):
+    pages = max(1, -(-total // PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=key)
+    offset = (page - 1) * PAGE_SIZE
+    st.caption(f"Showing {min(offset + 1, total)}–{min(offset + PAGE_SIZE, total)} of {total}")
+    return offset
+
+# With include_archive, visits moved to the yearly archives are listed too
+def show_paged_logs(start, end, key, empty_message, include_archive=False):
+    if include_archive:
+        from retention import count_all_submissions as count, query_all_submissions as query
+    else:
+        count, query = count_submissions, query_submissions
+    total = read(count, start, end)
+    if not total:
+        st.info(empty_message)
+        return
+    offset = page_offset(total, key)
+    st.write(read(query, start, end, PAGE_SIZE, offset))
+
+# The export module loads only when an admin actually downloads
+def download_csv():
+    from export_submissions import export_csv_bytes
+    return export_csv_bytes()
+
+def show_admin_download():
     st.markdown("## 🔐 Admin Access")
     password = st.text_input("Enter admin password", type="password")
     access = st.button("Access Download")
 
     if access and password == "light2025":
-        # Download CSV from database
-        with SessionLocal() as session:
-            submissions = session.query(Submission).all()
-            df_db = pd.DataFrame([
-                {
-                    "Timestamp": s.Timestamp,
-                    "Household": s.Household,
-                    "Male Adults": s.Male_Adults,
-                    "Male Ages": s.Male_Ages,
-                    "Female Adults": s.Female_Adults,
-                    "Female Ages": s.Female_Ages,
-                    "Number of Children": s.Number_of_Children,
-                    "Kids Ages": s.Kids_Ages,
-                    "School Levels": s.School_Levels,
-                    "Zip": s.Zip,
-                    "Referral": s.Referral,
-                    "Phone": s.Phone,
-                    "Email": s.Email,
-                    "Name": s.Name,
-                    "Arrival Mode": s.Arrival_Mode
-                }
-                for s in submissions
-            ])
-            # Ensure all columns are present and in correct order
-            for col in COLUMNS:
-                if col not in df_db.columns:
-                    df_db[col] = ""
-            df_db = df_db[COLUMNS]
-            csv_data = df_db.to_csv(index=False)
-        st.download_button("Download CSV", csv_data, file_name=f"submissions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-        # Show today's submission count
-        today = datetime.now().strftime('%Y-%m-%d')
-        todays_count = df_db[df_db["Timestamp"].str.startswith(today)].shape[0]
-        st.info(f"Forms submitted today: {todays_count}")
-        # Show submissions by date (e.g., Saturdays)
-        df_db['date'] = pd.to_datetime(df_db['Timestamp'], errors='coerce').dt.date
-        df_db['weekday'] = pd.to_datetime(df_db['Timestamp'], errors='coerce').dt.day_name()
-        saturdays = df_db[df_db['weekday'] == 'Saturday']
-        sat_counts = saturdays.groupby('date').size()
-        if not sat_counts.empty:
-            st.markdown("### Saturday Submission Counts")
-            st.write(sat_counts)
-        # View logs for today
-        st.markdown("---")
-        st.markdown("### View Today's Logs")
-        todays_logs = df_db[df_db["Timestamp"].str.startswith(today)]
-        if not todays_logs.empty:
-            st.write(todays_logs)
-        else:
-            st.info("No logs for today.")
-        # Filter logs by date
-        st.markdown("---")
-        st.markdown("### Filter Logs by Date")
-        filter_date = st.date_input("Select a date to view logs", key="admin_filter_date")
-        if filter_date:
-            filter_str = filter_date.strftime('%Y-%m-%d')
-            filtered_logs = df_db[df_db["Timestamp"].str.startswith(filter_str)]
-            if not filtered_logs.empty:
-                st.write(filtered_logs)
-            else:
-                st.info(f"No logs found for {filter_str}.")
-        # Search logs by any field
-        st.markdown("---")
-        st.markdown("### Search Logs by Any Field")
-        search_term = st.text_input("Enter search term (any value)", key="admin_search")
-        if search_term:
-            mask = df_db.apply(lambda row: search_term.lower() in row.astype(str).str.lower().to_string(), axis=1)
-            results = df_db[mask]
-            if not results.empty:
-                st.write(results)
-                # Option to delete a log by id
-                del_index = st.number_input("Enter row index to delete (see leftmost column above)", min_value=0, max_value=len(results)-1, step=1, key="admin_del_index")
-                del_pw = st.text_input("Admin password to delete", type="password", key="admin_del_pw")
-                if st.button("Delete Log"):
-                    if del_pw == "light2025":
-                        sub_id = results.index[del_index] + 1  # SQLite id is index+1
-                        delete_submission_by_id(sub_id)
-                        st.success(f"Log at index {del_index} deleted.")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Incorrect admin password.")
-                # Option to update a log
-                st.markdown("---")
-                st.markdown("### Update Log")
-                upd_index = st.number_input("Enter row index to update (see leftmost column above)", min_value=0, max_value=len(results)-1, step=1, key="admin_upd_index")
-                upd_pw = st.text_input("Admin password to update", type="password", key="admin_upd_pw")
-                if st.button("Update Log"):
-                    if upd_pw == "light2025":
-                        sub_id = results.index[upd_index] + 1
-                        upd_dict = {}
-                        for col in COLUMNS:
-                            upd_dict[col] = st.text_input(f"Update {col}", value=str(results.iloc[upd_index][col]), key=f"upd_{col}")
-                        if st.button("Confirm Update"):
-                            update_submission_by_id(sub_id, upd_dict)
-                            st.success(f"Log at index {upd_index} updated.")
-                            st.experimental_rerun()
-                    else:
-                        st.error("Incorrect admin password.")
-            else:
-                st.warning("No matching logs found.")
+        # Remember the login so paging widgets below survive reruns
+        st.session_state["admin_authenticated"] = True
     elif access and password:
         st.error("Incorrect password.")
+    if not st.session_state.get("admin_authenticated"):
+        return
+
+    # Download CSV from database; the export only runs when the button is clicked
+    st.download_button("Download CSV", download_csv, file_name=f"submissions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    # Show today's submission count
+    today = datetime.now().strftime('%Y-%m-%d')
+    todays_count = read(daily_visit_count, today)
+    st.info(f"Forms submitted today: {todays_count}")
+    # Show submissions by date (e.g., Saturdays)
+    saturday_total = read(count_weekday_stats, 6)
+    if saturday_total:
+        st.markdown("### Saturday Submission Counts")
+        offset = page_offset(saturday_total, "admin_saturday_page")
+        st.write(read(weekday_stats, 6, PAGE_SIZE, offset))
+    # Weekly totals and where clients come from
+    week_total = read(count_weeks)
+    if week_total:
+        st.markdown("### Weekly Report")
+        offset = page_offset(week_total, "admin_week_page")
+        st.write(read(weekly_stats, PAGE_SIZE, offset))
+        st.markdown("### Visits by Zip Code")
+        zip_range = st.date_input("Date range", value=(datetime.now() - timedelta(days=30), datetime.now()), key="admin_zip_range")
+        if len(zip_range) == 2:
+            zip_start, zip_end = (d.strftime('%Y-%m-%d') for d in zip_range)
+            st.write(read(zip_distribution, zip_start, next_day(zip_end)))
+            st.markdown("### Ages and School Levels")
+            st.write(read(age_breakdown, zip_start, next_day(zip_end)))
+            st.write(read(school_level_breakdown, zip_start, next_day(zip_end)))
+    # Whole-table scan for families registered twice
+    st.markdown("---")
+    st.markdown("### Possible Duplicate Households")
+    if st.button("Scan for duplicates"):
+        pairs = [
+            {"Match": round(score, 3), "Name": a["Name"], "Other name": b["Name"], "Zip": a["Zip"],
+             "Phone": a["Phone"], "Other phone": b["Phone"], "Email": a["Email"], "Other email": b["Email"]}
+            for a, b, score in find_duplicate_pairs()
+        ]
+        if pairs:
+            st.write(f"{len(pairs)} possible duplicate pairs (python duplicates.py exports them as CSV)")
+            st.dataframe(sorted(pairs, key=lambda p: -p["Match"]))
+        else:
+            st.info("No likely duplicates found.")
+    # View logs for today
+    st.markdown("---")
+    st.markdown("### View Today's Logs")
+    show_paged_logs(today, next_day(today), "admin_today_page", "No logs for today.")
+    # Filter logs by date
+    st.markdown("---")
+    st.markdown("### Filter Logs by Date")
+    filter_date = st.date_input("Select a date to view logs", key="admin_filter_date")
+    # Old visits live in yearly archive files once retention.py has run. Like
+    # the export module, the archive code loads only on this page.
+    from retention import archive_years
+    include_archive = bool(archive_years()) and st.checkbox("Include archived visits", key="admin_include_archive")
+    if filter_date:
+        filter_str = filter_date.strftime('%Y-%m-%d')
+        show_paged_logs(filter_str, next_day(filter_str), "admin_filter_page", f"No logs found for {filter_str}.", include_archive)
+    # Search logs by any field
+    st.markdown("---")
+    st.markdown("### Search Logs by Any Field")
+    search_term = st.text_input("Enter search term (any value)", key="admin_search")
+    if search_term:
+        total = read(count_search_results, search_term)
+        results = read(search_submissions, search_term, PAGE_SIZE, page_offset(total, "admin_search_page")) if total else submissions_to_df([])
+        if not results.empty:
+            st.write(results)
+            # Option to delete a log by id (the DataFrame index is the visit id)
+            del_id = st.selectbox("Log to delete (id, leftmost column above)", results.index.tolist(), key="admin_del_id")
+            del_pw = st.text_input("Admin password to delete", type="password", key="admin_del_pw")
+            if st.button("Delete Log"):
+                if del_pw == "light2025":
+                    delete_submission_by_id(int(del_id))
+                    st.success(f"Log {del_id} deleted.")
+                    st.rerun()
+                else:
+                    st.error("Incorrect admin password.")
+            # Option to update a log
+            st.markdown("---")
+            st.markdown("### Update Log")
+            upd_id = st.selectbox("Log to update (id, leftmost column above)", results.index.tolist(), key="admin_upd_id")
+            upd_pw = st.text_input("Admin password to update", type="password", key="admin_upd_pw")
+            if st.button("Update Log"):
+                if upd_pw == "light2025":
+                    # Real visit id plus the version the edit starts from
+                    sub_id = int(upd_id)
+                    row, version = get_submission(sub_id)
+                    st.session_state["admin_update_target"] = {"id": sub_id, "version": version, "row": row}
+                else:
+                    st.error("Incorrect admin password.")
+            target = st.session_state.get("admin_update_target")
+            if target:
+                with st.form("admin_update_form"):
+                    upd_dict = {}
+                    for col in COLUMNS:
+                        value = target["row"][col]
+                        upd_dict[col] = st.text_input(f"Update {col}", value="" if value is None else str(value), key=f"upd_{col}")
+                    if st.form_submit_button("Confirm Update"):
+                        result = update_submission_by_id(target["id"], upd_dict, expected_version=target["version"])
+                        del st.session_state["admin_update_target"]
+                        if result == UPDATED:
+                            st.success(f"Log {target['id']} updated.")
+                        else:
+                            st.error(UPDATE_FAILURES[result])
+        else:
+            st.warning("No matching logs found.")
 
 # ------------------ Main App Logic ------------------
 
+configure_logging()
+start_metrics_server()
+
 st.set_page_config(page_title="Bring the Light – Intake Form", layout="centered")
 st.title("Bring the Light – Food Bank Intake Form")
 
@@ -462,22 +475,39 @@ if "reset_form" in st.session_state:
 
     # CSV file creation removed; only SQLite used
 
-# Load submissions
-df = load_submissions()
-
 # Sidebar navigation for better UX
 st.sidebar.title("Navigation")
-section = st.sidebar.radio("Go to:", ["Lookup", "New Submission", "Update", "Admin", "Privacy Notice"])
-
-if section == "Lookup":
-    show_lookup_section(df)
-elif section == "New Submission":
-    show_submission_form(df)
-elif section == "Update":
-    show_update_section(df)
-elif section == "Admin":
-    show_admin_download(df)
-elif section == "Privacy Notice":
-    show_privacy_notice()
+if OUTBOX_ENABLED:
+    # Submissions saved on this host but not yet in the main database
+    outbox_counts = get_outbox().counts()
+    st.sidebar.caption(f"Pending sync: {outbox_counts.get(PENDING, 0)}")
+    if outbox_counts.get(FAILED):
+        st.sidebar.warning(f"{outbox_counts[FAILED]} submission(s) could not be synced. Please tell the admin.")
+# Pages that work from the outbox alone
+OFFLINE_SECTIONS = {"Quick Check-In", "New Submission"}
+section = st.sidebar.radio("Go to:", ["Lookup", "Quick Check-In", "New Submission", "Update", "Admin", "Privacy Notice"], key="section")
+
+with span("rerun", section=section):
+    if section != "Privacy Notice":
+        # Tables and migrations: once per process, on the first page that needs them.
+        # With the outbox, intake pages keep working while the main database is down.
+        try:
+            database.init_db()
+        except OperationalError:
+            if not (OUTBOX_ENABLED and section in OFFLINE_SECTIONS):
+                raise
+            st.warning("The main database is unavailable. New submissions and check-ins are saved on this device and synced later.")
+    if section == "Lookup":
+        show_lookup_section()
+    elif section == "Quick Check-In":
+        show_quick_check_in()
+    elif section == "New Submission":
+        show_submission_form()
+    elif section == "Update":
+        show_update_section()
+    elif section == "Admin":
+        show_admin_download()
+    elif section == "Privacy Notice":
+        show_privacy_notice()
 
 st.markdown("---")
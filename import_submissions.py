@@ -0,0 +1,294 @@
+"""Bulk import of historical intake data from CSV or JSONL files.
+
+Rows are streamed from the file, validated with the same rules as the intake
+form and written in large batched transactions. Phones already on file are
+matched through the Phone_clean index, so a returning household gets a new
+visit rather than a second household record. A household has at most one
+visit per day, so visits on a day already recorded are skipped, and so are
+visits in the period already moved to the archives (see retention.py).
+Rejected rows go to a CSV with the reason and original line:
+
+    python import_submissions.py legacy.csv --rejects legacy_rejects.csv
+    python import_submissions.py export.jsonl --batch-size 20000
+
+CSV files may have a header row using the app's column names. Headerless
+files are read in COLUMNS order, or in the old 12-column layout of the
+original submissions.csv.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import func, insert, select, text
+from database import (
+    COLUMNS, HOUSEHOLD_FIELDS, DailyStats, Household, SessionLocal, Visit, archived_before, bump_data_version,
+    engine_for_writes, init_db, insert_demographics, normalize_phone, rebuild_rollups, refresh_rollups,
+    validate_inputs, visit_date,
+)
+from instrumentation import configure_logging, log, span
+
+IMPORT_BATCH_SIZE = 5000
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+# Layout of the original headerless submissions.csv
+LEGACY_CSV_COLUMNS = [
+    "Timestamp", "Household", "Male Adults", "Male Ages", "Female Adults", "Female Ages",
+    "School Levels", "Kids Ages", "Zip", "Referral", "Phone", "Email",
+]
+INTEGER_FIELDS = ["Household", "Male Adults", "Female Adults", "Number of Children"]
+CANONICAL_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+TIMESTAMP_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+class RowError(ValueError):
+    pass
+
+def label_for(key):
+    # Accept both "Male Adults" and "Male_Adults" style keys
+    key = key.strip()
+    spaced = key.replace("_", " ")
+    return spaced if spaced in COLUMNS else key
+
+# Yield (line number, row dict or None, raw text, error or None)
+def iter_csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = None
+        for values in reader:
+            line = reader.line_num
+            raw = ",".join(values)
+            if not any(v.strip() for v in values):
+                continue
+            if header is None:
+                labels = [label_for(v) for v in values]
+                if "Timestamp" in labels or "Phone" in labels:
+                    header = labels
+                    continue
+                header = COLUMNS if len(values) == len(COLUMNS) else LEGACY_CSV_COLUMNS
+            if len(values) != len(header):
+                yield line, None, raw, f"expected {len(header)} fields, got {len(values)}"
+                continue
+            yield line, dict(zip(header, values)), raw, None
+
+def iter_jsonl_rows(path):
+    with open(path, encoding="utf-8") as f:
+        for line, raw in enumerate(f, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                obj = json.loads(raw)
+            except json.JSONDecodeError as e:
+                yield line, None, raw, f"invalid JSON: {e.msg}"
+                continue
+            if not isinstance(obj, dict):
+                yield line, None, raw, "expected a JSON object"
+                continue
+            yield line, {label_for(k): v for k, v in obj.items()}, raw, None
+
+def parse_timestamp(value):
+    value = str(value or "").strip()
+    # Fast path for the app's own format
+    if CANONICAL_TIMESTAMP.fullmatch(value):
+        return value
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    raise RowError(f"invalid timestamp {value!r}")
+
+# Validate and normalize one row into the row_dict shape save_submission takes
+def clean_row(row):
+    row = {label: ("" if row.get(label) is None else str(row.get(label)).strip()) for label in COLUMNS}
+    errors = validate_inputs(row["Phone"], row["Email"], row["Zip"])
+    if errors:
+        raise RowError(" ".join(errors))
+    row["Timestamp"] = parse_timestamp(row["Timestamp"])
+    for label in INTEGER_FIELDS:
+        try:
+            row[label] = int(float(row[label])) if row[label] else 0
+        except ValueError:
+            raise RowError(f"{label} is not a number: {row[label]!r}")
+    row["Household"] = row["Household"] or 1
+    row["Phone_clean"] = normalize_phone(row["Phone"])
+    return row
+
+def chunks(items, size=LOOKUP_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Visits matching n (household_id, Visit_Date) pairs. An OR of pairs is one
+# index search each, where SQLite scans the whole index for a row-value IN.
+# Two parameters per pair, hence chunks of LOOKUP_CHUNK // 2.
+@lru_cache(maxsize=None)
+def recorded_visits_sql(n):
+    return text(
+        'SELECT household_id, "Visit_Date" FROM visits WHERE '
+        + " OR ".join(f'(household_id = :h{i} AND "Visit_Date" = :d{i})' for i in range(n))
+    )
+
+class Importer:
+    def __init__(self, rejects_writer=None, batch_size=IMPORT_BATCH_SIZE):
+        self.rejects_writer = rejects_writer
+        self.batch_size = batch_size
+        self.stats = {"read": 0, "visits": 0, "households": 0, "duplicates": 0, "rejected": 0}
+        self._seen = set()  # (phone_clean, day) already in this file
+        self._days = set()  # days that got visits, for the rollups
+
+    def reject(self, line, reason, raw):
+        self.stats["rejected"] += 1
+        if self.rejects_writer:
+            self.rejects_writer.writerow([line, reason, raw])
+
+    def run(self, rows):
+        # Rollups before the archive horizon are final, so those days cannot take new visits
+        with SessionLocal() as session:
+            horizon = archived_before(session) or ""
+        batch = []
+        try:
+            for line, row, raw, error in rows:
+                self.stats["read"] += 1
+                if error is None:
+                    try:
+                        row = clean_row(row)
+                    except RowError as e:
+                        error = str(e)
+                if error:
+                    self.reject(line, error, raw)
+                    continue
+                key = (row["Phone_clean"], visit_date(row["Timestamp"]))
+                if key[1] < horizon:
+                    self.reject(line, f"visit before {horizon} falls in the archived period", raw)
+                    continue
+                if key in self._seen:
+                    self.stats["duplicates"] += 1
+                    self.reject(line, "second visit on the same day in file", raw)
+                    continue
+                self._seen.add(key)
+                batch.append((line, row, raw))
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+            if batch:
+                self.write_batch(batch)
+        finally:
+            # Whatever the batches committed, even if a later one failed
+            self.finish()
+        return self.stats
+
+    # Rollups once for the whole file: historical files touch most days, so
+    # refreshing per batch recomputed the same buckets again and again. Past
+    # half the days already on file, one GROUP BY over all visits is cheaper
+    # than a range scan per day.
+    def finish(self):
+        if not self._days:
+            return
+        with span("import.rollups", days=len(self._days)), engine_for_writes().begin() as conn:
+            days_on_file = conn.execute(select(func.count()).select_from(DailyStats)).scalar()
+            if len(self._days) > days_on_file / 2:
+                rebuild_rollups(conn)
+            else:
+                refresh_rollups(conn, self._days)
+            bump_data_version(conn)
+        self._days = set()
+
+    # phone_clean -> household id, through the Phone_clean index
+    def lookup_households(self, conn, phones):
+        household_ids = {}
+        for chunk in chunks(phones):
+            for household_id, phone_clean in conn.execute(
+                select(Household.id, Household.Phone_clean).where(Household.Phone_clean.in_(chunk))
+            ):
+                household_ids.setdefault(phone_clean, household_id)
+        return household_ids
+
+    # One transaction per batch: new households, then visits not already on file
+    def write_batch(self, batch):
+        with span("import.batch"), engine_for_writes().begin() as conn:
+            household_ids = self.lookup_households(conn, {row["Phone_clean"] for _, row, _ in batch})
+            existing = set(household_ids.values())
+
+            new_households = {}
+            for _, row, _ in batch:
+                if row["Phone_clean"] not in household_ids and row["Phone_clean"] not in new_households:
+                    new_households[row["Phone_clean"]] = {
+                        "Phone_clean": row["Phone_clean"],
+                        **{attr: row[label] for label, attr in HOUSEHOLD_FIELDS.items()},
+                    }
+            if new_households:
+                # Plain executemany, then read the new ids back through the index;
+                # much faster than INSERT ... RETURNING row by row
+                conn.execute(insert(Household), list(new_households.values()))
+                household_ids.update(self.lookup_households(conn, new_households))
+                # Ages and school levels for the whole batch in one vectorized pass
+                insert_demographics(conn, pd.DataFrame(
+                    list(new_households.values()), index=[household_ids[phone] for phone in new_households]
+                ))
+                self.stats["households"] += len(new_households)
+
+            # This batch's days already recorded for households that were on file before it
+            keys = [(household_ids[row["Phone_clean"]], visit_date(row["Timestamp"])) for _, row, _ in batch]
+            recorded = set()
+            for chunk in chunks({k for k in keys if k[0] in existing}, LOOKUP_CHUNK // 2):
+                params = {}
+                for i, (household_id, day) in enumerate(chunk):
+                    params[f"h{i}"], params[f"d{i}"] = household_id, day
+                recorded.update(conn.execute(recorded_visits_sql(len(chunk)), params).all())
+
+            visits = []
+            for (line, row, raw), key in zip(batch, keys):
+                if key in recorded:
+                    self.stats["duplicates"] += 1
+                    self.reject(line, "visit already recorded for that day", raw)
+                    continue
+                visits.append({
+                    "household_id": key[0], "Timestamp": row["Timestamp"], "Visit_Date": key[1],
+                    "Arrival_Mode": row["Arrival Mode"] or None,
+                })
+            if visits:
+                conn.execute(insert(Visit), visits)
+                self._days.update(visit["Visit_Date"] for visit in visits)
+                self.stats["visits"] += len(visits)
+            bump_data_version(conn)
+        log.info("Imported batch: %s", self.stats)
+
+def import_file(path, rejects_path=None, batch_size=IMPORT_BATCH_SIZE, fmt=None):
+    init_db()
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    rows = iter_jsonl_rows(path) if fmt == "jsonl" else iter_csv_rows(path)
+    rejects_file = open(rejects_path, "w", newline="") if rejects_path else None
+    try:
+        writer = None
+        if rejects_file:
+            writer = csv.writer(rejects_file)
+            writer.writerow(["line", "reason", "raw"])
+        return Importer(writer, batch_size).run(rows)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import historical intake data.")
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--rejects", help="write rejected rows here (default: <path>.rejects.csv)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    configure_logging()
+    rejects = args.rejects or f"{os.path.splitext(args.path)[0]}.rejects.csv"
+    start = time.perf_counter()
+    stats = import_file(args.path, rejects, args.batch_size, args.format)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(stats))
+    if stats["rejected"]:
+        print(f"Rejected rows written to {rejects}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Timing spans, counters and structured logs for the intake app's hot paths.
+
+Spans feed in-process histograms that can be scraped in Prometheus text
+format (set FOODBANK_METRICS_PORT to serve /metrics). A sample of spans,
+FOODBANK_TRACE_SAMPLE (default 0.1), is also logged as one JSON object per
+line. Anything that might carry client details goes through redact() first.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_SAMPLE_RATE = float(os.environ.get("FOODBANK_TRACE_SAMPLE", "0.1"))
+METRICS_PORT = os.environ.get("FOODBANK_METRICS_PORT")
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger("foodbank")
+trace_log = logging.getLogger("foodbank.trace")
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+_counters = {}  # (name, labels) -> value
+
+def configure_logging():
+    level = os.environ.get("FOODBANK_LOG_LEVEL", "INFO").upper()
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        log.addHandler(handler)
+        log.setLevel(level)
+        log.propagate = False
+
+# ------------------ PII redaction ------------------
+
+REDACTED_FIELDS = {"Phone", "Phone_clean", "Email", "Name"}
+
+def redact_value(key, value):
+    if value in (None, ""):
+        return value
+    text = str(value)
+    if key in ("Phone", "Phone_clean"):
+        digits = re.sub(r"\D", "", text)
+        return f"***{digits[-2:]}" if digits else "***"
+    if key == "Email":
+        user, _, domain = text.partition("@")
+        return f"{user[:1]}***@{domain}" if domain else "***"
+    return "***"
+
+# Copy of a row dict that is safe to log
+def redact(row_dict):
+    return {k: redact_value(k, v) if k.replace(" ", "_") in REDACTED_FIELDS else v for k, v in row_dict.items()}
+
+# ------------------ Metrics ------------------
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+
+def increment(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+# Time a block: feeds the histogram and, for a sample of calls, the trace log
+@contextmanager
+def span(name, **labels):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        # Only real errors; Streamlit's st.stop()/st.rerun() raise BaseExceptions
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed, **labels)
+        if error:
+            increment("errors", op=name, error=error)
+        if random.random() < TRACE_SAMPLE_RATE:
+            record = {"span": name, "ms": round(elapsed * 1000, 3), **labels}
+            if error:
+                record["error"] = error
+            trace_log.info(json.dumps(record))
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+def render_prometheus():
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    if histograms:
+        lines.append("# HELP foodbank_span_seconds Duration of instrumented operations.")
+        lines.append("# TYPE foodbank_span_seconds histogram")
+        for (name, labels), hist in sorted(histograms.items()):
+            labels = (("op", name),) + labels
+            for i, bound in enumerate(BUCKETS):
+                lines.append(f"foodbank_span_seconds_bucket{_format_labels(labels, [('le', bound)])} {hist[i]}")
+            lines.append(f"foodbank_span_seconds_bucket{_format_labels(labels, [('le', '+Inf')])} {hist[-2]}")
+            lines.append(f"foodbank_span_seconds_count{_format_labels(labels)} {hist[-2]}")
+            lines.append(f"foodbank_span_seconds_sum{_format_labels(labels)} {hist[-1]:.6f}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE foodbank_{name}_total counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"foodbank_{name}_total{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+# ------------------ /metrics endpoint ------------------
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server_started = False
+
+# Serve /metrics on a background thread; safe to call on every rerun
+def start_metrics_server(port=METRICS_PORT):
+    global _server_started
+    if not port:
+        return
+    with _lock:
+        if _server_started:
+            return
+        _server_started = True
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+    except OSError as e:
+        log.warning("Metrics endpoint not started on port %s: %s", port, e)
+        return
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Serving metrics on port %s", port)
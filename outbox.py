@@ -0,0 +1,183 @@
+"""Durable local outbox for intake submissions and check-ins.
+
+With FOODBANK_OUTBOX=1, a submission is first appended to a small SQLite
+file on this host (FOODBANK_OUTBOX_FILE, fully synced on every commit) and a
+background thread drains it into the main database. Volunteers see "saved"
+as soon as the local append commits, even while the main database is
+unreachable or locked. Every submission carries a client-generated
+Client_Id, so a drain retried after a failure records it only once.
+
+Check-ins go to the main database directly and are only queued here when it
+is unavailable (see write_queue.submit_check_in); replaying one is harmless,
+since a household has one visit per day. The intake pages skip their
+duplicate checks while the main database is down.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, Integer, MetaData, String, Table, case, delete, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from database import NOT_FOUND, check_in, create_db_engine, init_db, write_submissions
+from instrumentation import increment, log, redact, span
+
+OUTBOX_ENABLED = os.environ.get("FOODBANK_OUTBOX") == "1"
+OUTBOX_FILE = os.environ.get("FOODBANK_OUTBOX_FILE", "outbox.db")
+OUTBOX_BATCH_SIZE = int(os.environ.get("FOODBANK_OUTBOX_BATCH_SIZE", "100"))
+# Seconds between drain attempts while the main database is unavailable
+OUTBOX_RETRY_WAIT = float(os.environ.get("FOODBANK_OUTBOX_RETRY_WAIT", "5"))
+# A submission the main database keeps rejecting is parked as failed
+OUTBOX_MAX_ATTEMPTS = 5
+
+PENDING, FAILED = "pending", "failed"
+# Payload flag: a returning household's check-in rather than a full submission
+CHECK_IN = "Check_In"
+
+metadata = MetaData()
+outbox_table = Table(
+    "outbox", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("Client_Id", String, nullable=False, unique=True),
+    Column("Payload", String, nullable=False),  # the row_dict as JSON
+    Column("Created_At", String, nullable=False),
+    Column("Status", String, nullable=False, default=PENDING, index=True),
+    Column("Attempts", Integer, nullable=False, default=0),
+    Column("Last_Error", String),
+)
+
+def set_full_sync(dbapi_connection, connection_record):
+    # Runs after create_db_engine's pragmas: an acknowledged append survives power loss
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.close()
+
+class Outbox:
+    # With background=False nothing syncs until the caller runs drain() itself
+    def __init__(self, path=OUTBOX_FILE, batch_size=OUTBOX_BATCH_SIZE, retry_wait=OUTBOX_RETRY_WAIT, background=True):
+        self.batch_size = batch_size
+        self.retry_wait = retry_wait
+        self.engine = create_db_engine(path)
+        event.listen(self.engine, "connect", set_full_sync)
+        metadata.create_all(self.engine)
+        self._wake = threading.Event()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="outbox-sync", daemon=True)
+            self._thread.start()
+
+    # Append a submission; True once it is on disk locally. Appending the same
+    # Client_Id twice keeps the first.
+    def append(self, row_dict):
+        row_dict = dict(row_dict, Client_Id=row_dict.get("Client_Id") or str(uuid.uuid4()))
+        try:
+            with span("outbox.append"), self.engine.execution_options(sqlite_immediate=True).begin() as conn:
+                conn.execute(
+                    sqlite_insert(outbox_table)
+                    .values(
+                        Client_Id=row_dict["Client_Id"],
+                        Payload=json.dumps(row_dict, default=str),
+                        Created_At=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    )
+                    .on_conflict_do_nothing(index_elements=["Client_Id"])
+                )
+        except Exception:
+            log.exception("Failed to queue submission locally: %s", redact(row_dict))
+            return False
+        self._wake.set()
+        return True
+
+    # {status: count} of submissions not yet in the main database
+    def counts(self):
+        with self.engine.connect() as conn:
+            return dict(conn.execute(
+                select(outbox_table.c.Status, func.count()).group_by(outbox_table.c.Status)
+            ).all())
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.retry_wait)
+            self._wake.clear()
+            try:
+                # Inside the retry loop: the main database may be down at startup
+                init_db()
+                while self.drain():
+                    pass
+            except OperationalError as e:
+                log.warning("Main database unavailable, submissions stay queued: %s", getattr(e, "orig", e))
+            except Exception:
+                log.exception("Outbox sync failed")
+
+    # Move one batch into the main database; returns how many made it. An
+    # OperationalError (unreachable, locked) leaves the whole batch queued.
+    def drain(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(outbox_table.c.id, outbox_table.c.Payload)
+                .where(outbox_table.c.Status == PENDING)
+                .order_by(outbox_table.c.id)
+                .limit(self.batch_size)
+            ).all()
+        if not rows:
+            return 0
+        queued = [(row_id, json.loads(payload)) for row_id, payload in rows]
+        submissions = [(row_id, payload) for row_id, payload in queued if not payload.get(CHECK_IN)]
+        done = []
+        try:
+            if submissions:
+                with span("outbox.sync"):
+                    write_submissions([payload for _, payload in submissions])
+                done += [row_id for row_id, _ in submissions]
+        except OperationalError:
+            raise
+        except Exception:
+            # Something in the batch was rejected: one by one, so the rest get through
+            for row_id, payload in submissions:
+                try:
+                    write_submissions([payload])
+                    done.append(row_id)
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    self._record_failure(row_id, error_message(e))
+        # After the submissions, so a household queued earlier is on file by now
+        for row_id, payload in queued:
+            if payload.get(CHECK_IN):
+                if check_in(payload.get("Phone"), payload.get("Arrival Mode"), payload.get("Timestamp")) == NOT_FOUND:
+                    self._record_failure(row_id, "no household with this phone")
+                else:
+                    done.append(row_id)
+        if done:
+            with self.engine.execution_options(sqlite_immediate=True).begin() as conn:
+                conn.execute(delete(outbox_table).where(outbox_table.c.id.in_(done)))
+            increment("outbox_synced", len(done))
+        return len(done)
+
+    def _record_failure(self, row_id, message):
+        log.error("Outbox submission %s rejected by the main database: %s", row_id, message)
+        attempts = outbox_table.c.Attempts + 1
+        with self.engine.execution_options(sqlite_immediate=True).begin() as conn:
+            conn.execute(
+                update(outbox_table)
+                .where(outbox_table.c.id == row_id)
+                .values(
+                    Attempts=attempts,
+                    Last_Error=message,
+                    Status=case((attempts >= OUTBOX_MAX_ATTEMPTS, FAILED), else_=PENDING),
+                )
+            )
+
+# The DBAPI message only; SQLAlchemy's str() would include the row's values
+def error_message(error):
+    return str(getattr(error, "orig", None) or type(error).__name__)
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
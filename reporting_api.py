@@ -0,0 +1,285 @@
+"""Read-only JSON reporting API, run as its own process next to the app.
+
+Board members and partner agencies get the weekly numbers over HTTP instead
+of through the admin page, so reporting never runs on the process serving
+intake volunteers. WAL mode lets these reads proceed while tablets write.
+Every connection is opened with PRAGMA query_only. Visit lists leave out
+names, phones, emails, ages and referral notes.
+
+    python reporting_api.py --port 8502
+    curl 'http://localhost:8502/stats/weekly?start=2025-01-06'
+
+GET endpoints (dates are YYYY-MM-DD, `end` exclusive, both optional):
+    /visits?start=&end=&page=&page_size=   visits, oldest first, paginated
+    /stats/summary?start=&end=             totals over the range
+    /stats/daily?start=&end=               one row per day
+    /stats/weekly?start=&end=              one row per week (its Monday)
+    /stats/zips?start=&end=                visits and people per zip
+    /stats/zips?by=week&start=&end=        the same per week and zip
+    /stats/demographics?start=&end=        ages and school levels
+
+Responses carry the database write counter (data_version) as their ETag and
+are cached per URL until it changes. A client sending If-None-Match gets a
+304 after one primary-key read.
+"""
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from sqlalchemy import event, func, select
+import database
+from database import (
+    PAGE_SIZE, ROLLUP_COLUMNS, DailyStats, Household, SessionLocal, Visit, WeeklyStats, WeeklyZipStats,
+    age_breakdown, filter_visits, get_data_version, is_day, school_level_breakdown, zip_distribution,
+)
+from instrumentation import configure_logging, increment, log, span, start_metrics_server
+
+REPORTING_HOST = os.environ.get("FOODBANK_REPORTING_HOST", "127.0.0.1")
+REPORTING_PORT = int(os.environ.get("FOODBANK_REPORTING_PORT", "8502"))
+MAX_PAGE_SIZE = 500
+# Cached responses, least recently used dropped first
+CACHE_ENTRIES = 256
+
+class BadRequest(ValueError):
+    pass
+
+# (field, model attribute) published per visit: no client details
+VISIT_FIELDS = [
+    ("id", Visit.id),
+    ("Timestamp", Visit.Timestamp),
+    ("Arrival Mode", Visit.Arrival_Mode),
+    ("household_id", Visit.household_id),
+    ("Household", Household.Household),
+    ("Male Adults", Household.Male_Adults),
+    ("Female Adults", Household.Female_Adults),
+    ("Number of Children", Household.Number_of_Children),
+    ("Zip", Household.Zip),
+]
+# Summed over a range; Households is unique per day, so it cannot be summed
+SUMMARY_COLUMNS = [c for c in ROLLUP_COLUMNS if c != "Households"]
+
+# ------------------ Parameters ------------------
+
+def date_range(params):
+    start, end = params.get("start"), params.get("end")
+    for name, value in (("start", start), ("end", end)):
+        if value is not None and not is_day(value):
+            raise BadRequest(f"{name} must be a date (YYYY-MM-DD)")
+    return start, end
+
+def int_param(params, name, default, low, high):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"{name} must be a whole number")
+    if not low <= value <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return value
+
+def period_filter(query, model, start, end):
+    if start:
+        query = query.where(model.Period >= start)
+    if end:
+        query = query.where(model.Period < end)
+    return query
+
+# ------------------ Endpoints ------------------
+# Each takes the query parameters as a dict and returns a JSON-ready object
+
+def visits(params):
+    start, end = date_range(params)
+    page = int_param(params, "page", 1, 1, 10**9)
+    page_size = int_param(params, "page_size", PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    with SessionLocal() as session:
+        total = session.execute(filter_visits(select(func.count(Visit.id)), start, end)).scalar()
+        rows = session.execute(
+            filter_visits(
+                select(*[attr for _, attr in VISIT_FIELDS]).join(Household, Visit.household_id == Household.id),
+                start, end,
+            )
+            .order_by(Visit.Timestamp, Visit.id)
+            .limit(page_size).offset((page - 1) * page_size)
+        ).all()
+    return {
+        "page": page, "page_size": page_size, "total": total,
+        "visits": [dict(zip([name for name, _ in VISIT_FIELDS], row)) for row in rows],
+    }
+
+def rollup_rows(model, params):
+    start, end = date_range(params)
+    with SessionLocal() as session:
+        rows = session.execute(
+            period_filter(select(model), model, start, end).order_by(model.Period)
+        ).scalars().all()
+    return [{"period": row.Period, **{c: getattr(row, c) for c in ROLLUP_COLUMNS}} for row in rows]
+
+def daily(params):
+    return rollup_rows(DailyStats, params)
+
+def weekly(params):
+    return rollup_rows(WeeklyStats, params)
+
+def summary(params):
+    start, end = date_range(params)
+    with SessionLocal() as session:
+        row = session.execute(period_filter(
+            select(func.count(), *[func.coalesce(func.sum(getattr(DailyStats, c)), 0) for c in SUMMARY_COLUMNS]),
+            DailyStats, start, end,
+        )).one()
+    return {"start": start, "end": end, "days": row[0], **dict(zip(SUMMARY_COLUMNS, row[1:]))}
+
+# Per week, busiest zip first within each week
+def weekly_zips(params):
+    start, end = date_range(params)
+    with SessionLocal() as session:
+        rows = session.execute(
+            period_filter(select(WeeklyZipStats), WeeklyZipStats, start, end)
+            .order_by(WeeklyZipStats.Period, WeeklyZipStats.Visits.desc(), WeeklyZipStats.Zip)
+        ).scalars().all()
+    return [
+        {"period": row.Period, "zip": row.Zip or "(none)", **{c: getattr(row, c) for c in ROLLUP_COLUMNS}}
+        for row in rows
+    ]
+
+def zips(params):
+    by = params.get("by")
+    if by == "week":
+        return weekly_zips(params)
+    if by is not None:
+        raise BadRequest("by must be week")
+    return zip_distribution(*date_range(params)).reset_index().to_dict("records")
+
+def demographics(params):
+    start, end = date_range(params)
+    return {
+        "ages": age_breakdown(start, end).to_dict(),
+        "school_levels": school_level_breakdown(start, end).to_dict(),
+    }
+
+ROUTES = {
+    "/visits": visits,
+    "/stats/summary": summary,
+    "/stats/daily": daily,
+    "/stats/weekly": weekly,
+    "/stats/zips": zips,
+    "/stats/demographics": demographics,
+}
+
+# ------------------ Response cache ------------------
+
+class ResponseCache:
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (data_version, body)
+        self._lock = threading.Lock()
+
+    # The cached body for `key`, if it was built from this data_version
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+_cache = ResponseCache()
+
+# ------------------ HTTP ------------------
+
+def etag_matches(header, etag):
+    return header is not None and any(tag.strip() in (etag, f"W/{etag}", "*") for tag in header.split(","))
+
+class ReportingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_json(404, {"error": "not found", "endpoints": sorted(ROUTES)})
+            return
+        params = dict(parse_qsl(url.query))
+        with span("reporting.request", route=url.path):
+            version = get_data_version()
+            etag = f'"{version}"'
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                increment("reporting_not_modified", route=url.path)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            # Same parameters in any order share one entry
+            key = (url.path, urlencode(sorted(params.items())))
+            body = _cache.get(key, version)
+            if body is None:
+                increment("reporting_cache_misses", route=url.path)
+                try:
+                    body = json.dumps(route(params)).encode()
+                except BadRequest as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                _cache.put(key, version, body)
+            self.send_body(200, body, etag)
+
+    def send_json(self, status, obj):
+        self.send_body(status, json.dumps(obj).encode())
+
+    def send_body(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            # Cache, but check the ETag before reusing
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("reporting %s", format % args)
+
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+# Bring the schema up to date once, then reopen every connection read-only
+def open_read_only(db_file=None):
+    if db_file:
+        database.configure(db_file)
+    else:
+        database.init_db()
+    event.listen(database.engine, "connect", set_query_only)
+    database.engine.dispose()
+
+def make_server(host=REPORTING_HOST, port=REPORTING_PORT):
+    return ThreadingHTTPServer((host, port), ReportingHandler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve read-only reporting JSON.")
+    parser.add_argument("--host", default=REPORTING_HOST, help="interface to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=REPORTING_PORT)
+    parser.add_argument("--db", help="database file (default: FOODBANK_DB_FILE)")
+    args = parser.parse_args(argv)
+    configure_logging()
+    start_metrics_server()
+    open_read_only(args.db)
+    server = make_server(args.host, args.port)
+    log.info("Serving reports on http://%s:%s", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
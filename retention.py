@@ -0,0 +1,218 @@
+"""Retention: move old visits out of submissions.db into yearly Parquet archives.
+
+Visits older than the retention window go to ARCHIVE_DIR/visits_<year>.parquet
+(zstd-compressed), one row per visit with the household's details as they
+were when archived. The cutoff is always a Monday, so no day or week rollup
+is split between the database and the archives. The rollup rows are kept, so
+reports from the rollup tables still cover the whole history. Households stay
+in the database, so returning families can still check in. The database is
+vacuumed and analyzed afterwards.
+
+    python retention.py                  # keep FOODBANK_RETENTION_DAYS of visits
+    python retention.py --days 365 --archive-dir /srv/foodbank/archive
+    python retention.py --dry-run
+
+The admin log views can read the archives back (count_all_submissions and
+query_all_submissions), in the same shape as the live rows.
+"""
+import argparse
+import glob
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import (
+    COLUMNS, ArchiveState, Household, SessionLocal, Visit, archived_before, bump_data_version,
+    count_submissions, engine_for_writes, init_db, query_submissions, week_start,
+)
+from export_submissions import EXPORT_FIELDS
+from instrumentation import configure_logging, log, span, timed
+
+RETENTION_DAYS = int(os.environ.get("FOODBANK_RETENTION_DAYS", "730"))
+ARCHIVE_DIR = os.environ.get("FOODBANK_ARCHIVE_DIR", "archive")
+
+# (column, model attribute) stored per archived visit: the visit id and the
+# export columns first, then what is needed to trace it back
+ARCHIVE_FIELDS = [
+    ("id", Visit.id),
+    *EXPORT_FIELDS,
+    ("household_id", Visit.household_id),
+    ("Visit_Date", Visit.Visit_Date),
+    ("Client_Id", Visit.Client_Id),
+]
+
+def require_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Archives need pyarrow: pip install pyarrow")
+    return pq
+
+def archive_path(year, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"visits_{year}.parquet")
+
+def archive_years(archive_dir=ARCHIVE_DIR):
+    paths = glob.glob(os.path.join(archive_dir, "visits_*.parquet"))
+    return sorted(os.path.basename(path)[len("visits_"):-len(".parquet")] for path in paths)
+
+# Monday on or before the day `days` ago: visits before it get archived
+def retention_cutoff(days=RETENTION_DAYS, today=None):
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    return week_start((datetime.strptime(today, "%Y-%m-%d") - timedelta(days=days)).strftime("%Y-%m-%d"))
+
+# Whole-number columns, kept as nullable integers whatever a year's NULLs look like
+INTEGER_FIELDS = ["id", "Household", "Male Adults", "Female Adults", "Number of Children", "household_id"]
+
+# Merge `frame` into the year's file. Written to a temporary file and renamed,
+# so a crash leaves the previous archive intact. Visits already in the file
+# (a run interrupted after writing) are kept once.
+def write_archive(year, frame, archive_dir=ARCHIVE_DIR):
+    import pandas as pd
+    path = archive_path(year, archive_dir)
+    frame = frame.astype({name: "Int64" for name in INTEGER_FIELDS})
+    if os.path.exists(path):
+        frame = pd.concat([pd.read_parquet(path), frame]).drop_duplicates("id", keep="first")
+    frame = frame.sort_values(["Timestamp", "id"])
+    tmp = f"{path}.tmp"
+    frame.to_parquet(tmp, compression="zstd", index=False)
+    os.replace(tmp, path)
+
+# Archive visits before `cutoff` (a Monday) year by year, then delete exactly
+# those visits and move the archive horizon in one transaction. Returns the
+# number of visits archived.
+def archive_visits(cutoff, archive_dir=ARCHIVE_DIR):
+    import pandas as pd
+    from import_submissions import chunks
+    require_parquet()
+    year = func.substr(Visit.Timestamp, 1, 4)
+    with SessionLocal() as session:
+        horizon = archived_before(session)
+        if horizon and cutoff <= horizon:
+            return 0
+        years = [y for y in session.execute(
+            select(year).where(Visit.Timestamp < cutoff).distinct().order_by(year)
+        ).scalars() if y.isdigit()]
+    os.makedirs(archive_dir, exist_ok=True)
+    archived_ids = []
+    for y in years:
+        with span("retention.archive_year", year=y), SessionLocal() as session:
+            frame = pd.read_sql(
+                select(*[attr.label(name) for name, attr in ARCHIVE_FIELDS])
+                .join(Household, Visit.household_id == Household.id)
+                .where(year == y, Visit.Timestamp < cutoff),
+                session.connection(),
+            )
+        if frame.empty:
+            continue
+        write_archive(y, frame, archive_dir)
+        archived_ids.extend(int(i) for i in frame["id"])
+        log.info("Archived %d visits from %s to %s", len(frame), y, archive_path(y, archive_dir))
+    # Visits on file before the cutoff that were not archived (no usable
+    # timestamp, or added meanwhile) stay in the table
+    with span("retention.delete"), engine_for_writes().begin() as conn:
+        for chunk in chunks(archived_ids):
+            conn.execute(delete(Visit).where(Visit.id.in_(chunk)))
+        conn.execute(
+            sqlite_insert(ArchiveState).values(id=1, Archived_Before=cutoff)
+            .on_conflict_do_update(index_elements=["id"], set_={"Archived_Before": cutoff})
+        )
+        bump_data_version(conn)
+    return len(archived_ids)
+
+# Give the space back to the filesystem and refresh the planner statistics.
+# VACUUM cannot run inside a transaction, hence the raw connection.
+def compact():
+    with span("retention.compact"):
+        raw = engine_for_writes().raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute("VACUUM")
+            cursor.execute("ANALYZE")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cursor.close()
+        finally:
+            raw.close()
+
+def run_retention(days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, vacuum=True):
+    init_db()
+    cutoff = retention_cutoff(days)
+    archived = archive_visits(cutoff, archive_dir)
+    if archived and vacuum:
+        compact()
+    return cutoff, archived
+
+# ------------------ Reading the archives ------------------
+# Archived visits are all older than the live ones, so a date range reads
+# the archives first and the visits table after.
+
+def archive_filters(start=None, end=None):
+    filters = []
+    if start:
+        filters.append(("Timestamp", ">=", start))
+    if end:
+        filters.append(("Timestamp", "<", end))
+    return filters or None
+
+# Archive files that can hold visits between `start` and `end` (exclusive)
+def archive_paths(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    return [
+        archive_path(year, archive_dir) for year in archive_years(archive_dir)
+        if (not start or year >= start[:4]) and (not end or year <= end[:4])
+    ]
+
+@timed("retention.count_archived")
+def count_archived(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    paths = archive_paths(start, end, archive_dir)
+    if not paths:
+        return 0
+    pq = require_parquet()
+    return sum(pq.read_table(path, columns=["Timestamp"], filters=archive_filters(start, end)).num_rows for path in paths)
+
+# Archived visits as a submissions DataFrame (COLUMNS, indexed by visit id),
+# oldest first like query_submissions
+@timed("retention.query_archived")
+def query_archived(start=None, end=None, limit=None, offset=0, archive_dir=ARCHIVE_DIR):
+    import pandas as pd
+    frames = [
+        pd.read_parquet(path, columns=["id", *COLUMNS], filters=archive_filters(start, end))
+        for path in archive_paths(start, end, archive_dir)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS, index=pd.Index([], name="id"))
+    frame = pd.concat(frames).set_index("id")
+    stop = None if limit is None else offset + limit
+    return frame.iloc[offset:stop]
+
+def count_all_submissions(start=None, end=None):
+    return count_archived(start, end) + count_submissions(start, end)
+
+# query_submissions over the archives and the visits table together
+def query_all_submissions(start=None, end=None, limit=None, offset=0):
+    import pandas as pd
+    archived = count_archived(start, end)
+    frames = []
+    if offset < archived:
+        frames.append(query_archived(start, end, limit, offset))
+    remaining = None if limit is None else limit - sum(len(frame) for frame in frames)
+    if remaining is None or remaining > 0:
+        frames.append(query_submissions(start, end, remaining, max(0, offset - archived)))
+    return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old visits to yearly Parquet files.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="visits to keep in the database, in days")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip VACUUM (it blocks writers while it runs)")
+    args = parser.parse_args(argv)
+    configure_logging()
+    if args.dry_run:
+        init_db()
+        cutoff = retention_cutoff(args.days)
+        print(f"{count_submissions(None, cutoff)} visits before {cutoff} would be archived to {args.archive_dir}")
+        return
+    cutoff, archived = run_retention(args.days, args.archive_dir, vacuum=not args.no_vacuum)
+    print(f"Archived {archived} visits before {cutoff} to {args.archive_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+# A database in the pre-households layout: one `submissions` row per form
+def make_legacy_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE submissions (id INTEGER PRIMARY KEY, "Timestamp" VARCHAR, "Household" INTEGER, '
+        '"Male Adults" INTEGER, "Male Ages" VARCHAR, "Female Adults" INTEGER, "Female Ages" VARCHAR, '
+        '"Number of Children" INTEGER, "Kids Ages" VARCHAR, "School Levels" VARCHAR, "Zip" VARCHAR, '
+        '"Referral" VARCHAR, "Phone" VARCHAR, "Email" VARCHAR, "Name" VARCHAR, "Arrival Mode" VARCHAR)'
+    )
+    for row in rows:
+        columns = ", ".join(f'"{label}"' for label in row)
+        marks = ", ".join("?" for _ in row)
+        conn.execute(f"INSERT INTO submissions ({columns}) VALUES ({marks})", list(row.values()))
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def db(tmp_path):
+    database.configure(str(tmp_path / "submissions.db"))
+    yield database
+    database.engine.dispose()
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    def open_legacy(rows):
+        path = str(tmp_path / "legacy.db")
+        make_legacy_db(path, rows)
+        database.configure(path)
+        return database
+    yield open_legacy
+    database.engine.dispose()
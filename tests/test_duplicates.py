@@ -0,0 +1,26 @@
+from sqlalchemy import text
+from database import INVALID_NUMBER, UPDATED
+from duplicates import find_duplicate_candidates, find_duplicate_pairs
+
+def save(db, phone, name, household):
+    assert db.save_submission({
+        "Timestamp": "2025-03-01 10:00:00", "Phone": phone, "Name": name, "Zip": "75001", "Household": household,
+    })
+
+def test_non_numeric_counts_are_skipped(db):
+    save(db, "2145550000", "Ann Smith", 3)
+    save(db, "2145550001", "Ann Smith", 3)
+    # Free text left in an integer column by an older admin edit
+    with db.engine_for_writes().begin() as conn:
+        conn.execute(text("UPDATE households SET Household = 'two' WHERE Phone_clean = '2145550000'"))
+    candidates = find_duplicate_candidates({"Name": "Ann Smith", "Zip": "75001", "Phone": "4695550000", "Household": 3})
+    assert {c["Phone"] for c in candidates} == {"2145550000", "2145550001"}
+    assert len(list(find_duplicate_pairs())) == 1
+
+def test_update_rejects_non_numeric_counts(db):
+    save(db, "2145550000", "Ann Smith", 3)
+    sub_id, = db.query_submissions().index.tolist()
+    assert db.update_submission_by_id(sub_id, {"Household": "two"}) == INVALID_NUMBER
+    assert db.update_submission_by_id(sub_id, {"Household": " 4 ", "Male Adults": ""}) == UPDATED
+    row, _ = db.get_submission(sub_id)
+    assert row["Household"] == 4 and row["Male Adults"] is None
@@ -0,0 +1,28 @@
+import csv
+from import_submissions import import_file
+
+def test_import(db, tmp_path):
+    for day, phone in [("01", "2145550000"), ("02", "2145550010"), ("03", "2145550020")]:
+        assert db.save_submission({"Timestamp": f"2025-03-{day} 10:00:00", "Phone": phone, "Household": 2})
+    path, rejects = tmp_path / "history.csv", tmp_path / "rejects.csv"
+    path.write_text(
+        "Timestamp,Phone,Household,Name\n"
+        "2025-03-01 12:00:00,214-555-0000,2,Ann\n"   # day already recorded for this phone
+        "2025-03-08 10:00:00,214-555-0000,2,Ann\n"   # existing household, new day
+        "2025-03-08 11:00:00,2145550001,3,Bob\n"     # new household
+        "2025-03-08 15:00:00,2145550001,3,Bob\n"     # second visit that day in the file
+        "2025-03-08 16:00:00,12345,1,Cy\n"
+        "yesterday,2145550002,1,Di\n"
+    )
+    # Two rows per batch, so the file spans several transactions
+    stats = import_file(str(path), str(rejects), batch_size=2)
+    assert stats == {"read": 6, "visits": 2, "households": 1, "duplicates": 2, "rejected": 4}
+    with open(rejects, newline="") as f:
+        reasons = {int(line): reason for line, reason, _ in list(csv.reader(f))[1:]}
+    assert reasons[2] == "visit already recorded for that day"
+    assert reasons[5] == "second visit on the same day in file"
+    assert reasons[6] == "Please enter a valid phone number."
+    assert reasons[7].startswith("invalid timestamp")
+    assert db.find_submissions_by_phone("2145550000")["Timestamp"].tolist() == ["2025-03-01 10:00:00", "2025-03-08 10:00:00"]
+    assert db.find_submissions_by_phone("2145550001")["Household"].tolist() == [3]
+    assert db.daily_visit_count("2025-03-08") == 2 and db.daily_visit_count("2025-03-01") == 1
@@ -0,0 +1,34 @@
+from sqlalchemy import select, text
+from database import Visit
+
+def test_legacy_same_day_repeats_migrate(legacy_db):
+    db = legacy_db([
+        {"Timestamp": "2025-01-04 10:00:00", "Household": 3, "Phone": "555-555-1234", "Name": "Ann Smith", "Zip": "75243"},
+        {"Timestamp": "2025-01-04 10:05:00", "Household": 3, "Phone": "5555551234", "Name": "Ann Smith", "Zip": "75243"},
+        {"Timestamp": "2025-01-11 10:00:00", "Household": 4, "Phone": "5555551234", "Name": "Ann Smith", "Zip": "75243"},
+    ])
+    with db.SessionLocal() as session:
+        visits = session.execute(select(Visit.Timestamp, Visit.Visit_Date).order_by(Visit.id)).all()
+        tables = session.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars().all()
+    # Every row is kept; the same-day repeat is not a check-in for that day
+    assert visits == [
+        ("2025-01-04 10:00:00", "2025-01-04"),
+        ("2025-01-04 10:05:00", None),
+        ("2025-01-11 10:00:00", "2025-01-11"),
+    ]
+    assert "submissions_legacy" in tables and "submissions" not in tables
+    assert db.daily_visit_count("2025-01-04") == 2
+    assert len(db.find_submissions_by_phone("555-555-1234")) == 3
+
+def test_migration_runs_once(legacy_db):
+    db = legacy_db([{"Timestamp": "2025-01-04 10:00:00", "Phone": "5555551234"}])
+    db._initialized = False
+    db.init_db()
+    assert db.count_submissions() == 1
+
+def test_check_in_without_phone_matches_nothing(legacy_db):
+    db = legacy_db([{"Timestamp": "2025-01-04 10:00:00", "Name": "No Phone"}])
+    for phone in ["", "n/a", "555"]:
+        assert db.check_in(phone, "Walking") == db.NOT_FOUND
+        assert not db.checked_in_today(phone)
+    assert db.count_submissions() == 1
@@ -0,0 +1,42 @@
+import pytest
+from outbox import CHECK_IN, FAILED, OUTBOX_MAX_ATTEMPTS, PENDING, Outbox
+
+@pytest.fixture
+def outbox(db, tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), background=False)
+    yield outbox
+    outbox.engine.dispose()
+
+def submission(phone, timestamp, client_id):
+    return {"Timestamp": timestamp, "Phone": phone, "Household": 2, "Client_Id": client_id}
+
+def test_same_client_id_is_recorded_once(db, outbox):
+    row = submission("2145550000", "2025-03-01 10:00:00", "tablet-1-0001")
+    assert outbox.append(row)
+    assert outbox.drain() == 1
+    # A retry after the main database committed but before the outbox row was deleted
+    assert outbox.append(row)
+    assert outbox.drain() == 1
+    assert db.count_submissions() == 1
+
+def test_rejected_row_is_parked_after_max_attempts(db, outbox):
+    outbox.append(submission("2145550000", "2025-03-01 10:00:00", "a"))
+    # Second visit for the same household that day: refused by uq_visits_household_date
+    outbox.append(submission("2145550000", "2025-03-01 11:00:00", "b"))
+    outbox.append(submission("2145550001", "2025-03-01 11:30:00", "c"))
+    assert outbox.drain() == 2
+    assert db.count_submissions() == 2
+    # The first drain was attempt one
+    for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+        assert outbox.counts() == {PENDING: 1}
+        assert outbox.drain() == 0
+    assert outbox.counts() == {FAILED: 1}
+    assert outbox.drain() == 0
+
+def test_check_in_replays_after_the_household_is_created(db, outbox):
+    # Queued first, but its household only arrives with the submission after it
+    outbox.append({CHECK_IN: True, "Phone": "214-555-0000", "Arrival Mode": "Walking", "Timestamp": "2025-03-08 10:00:00"})
+    outbox.append(submission("2145550000", "2025-03-01 10:00:00", "a"))
+    assert outbox.drain() == 2
+    assert outbox.counts() == {}
+    assert db.query_submissions()["Timestamp"].tolist() == ["2025-03-01 10:00:00", "2025-03-08 10:00:00"]
@@ -0,0 +1,73 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import reporting_api
+
+@pytest.fixture
+def server(db, monkeypatch):
+    # Responses cached for another test's database must not be reused
+    monkeypatch.setattr(reporting_api, "_cache", reporting_api.ResponseCache())
+    server = reporting_api.make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def get(url, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+def save_visits(db, count, first=0):
+    for i in range(first, first + count):
+        assert db.save_submission({"Timestamp": f"2025-03-{i + 1:02d} 10:00:00", "Phone": f"21455500{i:02d}", "Household": 2})
+
+def test_zips_by_week(db):
+    for timestamp, phone, zip_code in [
+        ("2025-03-03 10:00:00", "2145550000", "75001"),
+        ("2025-03-08 10:00:00", "2145550001", "75002"),
+        ("2025-03-09 10:00:00", "2145550002", "75002"),
+        ("2025-03-10 10:00:00", "2145550000", "75001"),
+    ]:
+        assert db.save_submission({"Timestamp": timestamp, "Phone": phone, "Household": 2, "Zip": zip_code})
+    rows = reporting_api.zips({"by": "week", "start": "2025-03-01"})
+    assert [(r["period"], r["zip"], r["Visits"]) for r in rows] == [
+        ("2025-03-03", "75002", 2), ("2025-03-03", "75001", 1), ("2025-03-10", "75001", 1),
+    ]
+    assert sum(r["Individuals"] for r in rows) == 8
+    with pytest.raises(reporting_api.BadRequest):
+        reporting_api.zips({"by": "month"})
+
+def test_if_none_match_returns_304_until_a_write(db, server):
+    save_visits(db, 1)
+    status, headers, body = get(f"{server}/stats/daily")
+    etag = headers["ETag"]
+    assert status == 200 and json.loads(body)[0]["Visits"] == 1
+    status, headers, body = get(f"{server}/stats/daily", {"If-None-Match": etag})
+    assert status == 304 and headers["ETag"] == etag and body == b""
+    save_visits(db, 1, first=1)
+    status, headers, body = get(f"{server}/stats/daily", {"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag and len(json.loads(body)) == 2
+
+def test_visits_pagination_bounds(db):
+    save_visits(db, 5)
+    page = reporting_api.visits({"page": "2", "page_size": "2"})
+    assert page["total"] == 5 and [v["Timestamp"][:10] for v in page["visits"]] == ["2025-03-03", "2025-03-04"]
+    assert [v["id"] for v in reporting_api.visits({"page": "3", "page_size": "2"})["visits"]] == [5]
+    assert reporting_api.visits({"page": "4", "page_size": "2"})["visits"] == []
+    assert "Phone" not in page["visits"][0]
+    for params in ({"page": "0"}, {"page_size": "0"}, {"page_size": str(reporting_api.MAX_PAGE_SIZE + 1)}, {"page": "x"}):
+        with pytest.raises(reporting_api.BadRequest):
+            reporting_api.visits(params)
+
+def test_bad_request_is_a_400(db, server):
+    status, _, body = get(f"{server}/visits?page_size=100000")
+    assert status == 400 and "page_size" in json.loads(body)["error"]
+    status, _, body = get(f"{server}/stats/weekly?start=March")
+    assert status == 400 and json.loads(body) == {"error": "start must be a date (YYYY-MM-DD)"}
+    status, _, body = get(f"{server}/nope")
+    assert status == 404 and "/visits" in json.loads(body)["endpoints"]
@@ -0,0 +1,15 @@
+import retention
+from database import UPDATED
+
+def test_household_outlives_its_archived_visits(db, tmp_path):
+    db.save_submission({"Timestamp": "2023-03-01 10:00:00", "Phone": "2145550000", "Household": 2})
+    db.save_submission({"Timestamp": "2025-03-03 10:00:00", "Phone": "2145550000", "Household": 2})
+    assert retention.archive_visits("2024-01-01", str(tmp_path / "archive")) == 1
+    live, = db.query_submissions().index.tolist()
+    db.delete_submission_by_id(live)
+    # Its archived visit still points at it, so Lookup and Update find it
+    assert db.find_submissions_by_phone("214-555-0000").empty
+    household_id, row, version = db.get_household_by_phone("214-555-0000")
+    assert row["Phone"] == "2145550000" and row["Timestamp"] is None
+    assert db.update_household_by_id(household_id, {"Zip": "75001", "Arrival Mode": "Walking"}, version) == UPDATED
+    assert db.get_household_by_phone("2145550000")[1]["Zip"] == "75001"
@@ -0,0 +1,19 @@
+import pytest
+
+def ids(db, term):
+    return db.search_submissions(term).index.tolist()
+
+def test_search_follows_writes(db):
+    if not db.FTS_ENABLED:
+        pytest.skip("SQLite built without FTS5")
+    assert db.save_submission({"Timestamp": "2025-03-01 10:00:00", "Phone": "214-555-0000", "Name": "Ann Smith", "Household": 2})
+    sub_id, = db.query_submissions().index.tolist()
+    assert ids(db, "smith") == [sub_id] and ids(db, "2145550000") == [sub_id]
+    # households_fts_update: old terms out, new terms in
+    assert db.update_submission_by_id(sub_id, {"Name": "Ann Jones", "Phone": "469-555-0000"}) == db.UPDATED
+    assert ids(db, "smith") == [] and ids(db, "2145550000") == []
+    assert ids(db, "jones") == [sub_id] and ids(db, "4695550000") == [sub_id]
+    assert db.count_search_results("jones") == 1
+    # households_fts_delete: the household goes with its last visit
+    db.delete_submission_by_id(sub_id)
+    assert ids(db, "jones") == [] and db.count_search_results("ann") == 0
@@ -0,0 +1,45 @@
+from sqlalchemy import text
+from database import ALREADY_CHECKED_IN, CONFLICT, INVALID_TIMESTAMP, UPDATED
+
+def save(db, phone, timestamp, **fields):
+    assert db.save_submission({"Timestamp": timestamp, "Phone": phone, "Household": 2, **fields})
+
+def test_update_onto_a_day_already_visited(db):
+    save(db, "2145550000", "2025-03-01 10:00:00")
+    save(db, "2145550000", "2025-03-08 10:00:00")
+    first, second = db.query_submissions().index.tolist()
+    _, version = db.get_submission(second)
+    assert db.update_submission_by_id(second, {"Timestamp": "2025-03-01 12:00:00"}, version) == ALREADY_CHECKED_IN
+    row, new_version = db.get_submission(second)
+    assert row["Timestamp"] == "2025-03-08 10:00:00" and new_version == version
+    assert db.update_submission_by_id(second, {"Timestamp": "2025-03-02 12:00:00"}, version) == UPDATED
+    assert db.daily_visit_count("2025-03-08") == 0 and db.daily_visit_count("2025-03-02") == 1
+
+def test_update_rejects_malformed_timestamp(db):
+    save(db, "2145550000", "2025-03-01 10:00:00")
+    sub_id, = db.query_submissions().index.tolist()
+    assert db.update_submission_by_id(sub_id, {"Timestamp": "March 1st"}) == INVALID_TIMESTAMP
+    assert db.get_submission(sub_id)[0]["Timestamp"] == "2025-03-01 10:00:00"
+
+def test_update_from_a_stale_version_conflicts(db):
+    save(db, "2145550000", "2025-03-01 10:00:00", Zip="75001")
+    sub_id, = db.query_submissions().index.tolist()
+    _, version = db.get_submission(sub_id)
+    assert db.update_submission_by_id(sub_id, {"Zip": "75002"}, version) == UPDATED
+    # A second tablet still holding the old version
+    assert db.update_submission_by_id(sub_id, {"Zip": "75003", "Arrival Mode": "Driving"}, version) == CONFLICT
+    row, new_version = db.get_submission(sub_id)
+    assert row["Zip"] == "75002" and row["Arrival Mode"] is None and new_version == version + 1
+
+def test_update_without_changes_writes_nothing(db):
+    save(db, "2145550000", "2025-03-01 10:00:00", Zip="75001")
+    sub_id, = db.query_submissions().index.tolist()
+    row, version = db.get_submission(sub_id)
+    # A refresh would put the real count back
+    with db.engine_for_writes().begin() as conn:
+        conn.execute(text("UPDATE daily_stats SET Visits = 99"))
+    data_version = db.get_data_version()
+    assert db.update_submission_by_id(sub_id, {**row, "Household": "2"}, version) == UPDATED
+    assert db.get_submission(sub_id)[1] == version
+    assert db.get_data_version() == data_version
+    assert db.daily_visit_count("2025-03-01") == 99
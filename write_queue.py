@@ -0,0 +1,116 @@
+"""Optional background write queue for busy distribution days.
+
+With FOODBANK_WRITE_QUEUE=1, submissions from every tablet go to one worker
+thread that commits them in grouped transactions (up to WRITE_BATCH_SIZE rows,
+or whatever arrives within WRITE_BATCH_WAIT seconds). Each caller still
+blocks until its own row is committed, so volunteers only see "saved" for
+data that is really on disk.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from database import check_in, save_submission, write_submissions
+from outbox import CHECK_IN, OUTBOX_ENABLED, get_outbox
+from instrumentation import increment, log, span
+
+WRITE_QUEUE_ENABLED = os.environ.get("FOODBANK_WRITE_QUEUE") == "1"
+WRITE_BATCH_SIZE = int(os.environ.get("FOODBANK_WRITE_BATCH_SIZE", "50"))
+WRITE_BATCH_WAIT = float(os.environ.get("FOODBANK_WRITE_BATCH_WAIT", "0.01"))
+# How long a volunteer's request waits for its batch to commit
+WRITE_CONFIRM_TIMEOUT = 30
+# submit_check_in result when the check-in went to the outbox
+QUEUED = "queued"
+
+class WriteQueue:
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, batch_wait=WRITE_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    # Queue a submission; the Future resolves to True when committed
+    def submit(self, row_dict):
+        future = Future()
+        self._queue.put((row_dict, future))
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("Batch of %d submissions failed; retrying one by one", len(batch))
+                # One bad row should not sink the rest: retry them one by one
+                for row_dict, future in batch:
+                    future.set_result(save_submission(row_dict))
+            else:
+                for _, future in batch:
+                    future.set_result(True)
+
+    def _write(self, batch):
+        with span("db.write_batch"):
+            write_submissions([row_dict for row_dict, _ in batch])
+        # Average batch size = rows / batches
+        increment("write_queue_batches")
+        increment("write_queue_rows", len(batch))
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def get_write_queue():
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+        return _write_queue
+
+# Save through the outbox or the queue when enabled, directly otherwise.
+# Returns True once committed (with the outbox: committed locally).
+def submit_submission(row_dict):
+    if OUTBOX_ENABLED:
+        return get_outbox().append(row_dict)
+    if not WRITE_QUEUE_ENABLED:
+        return save_submission(row_dict)
+    try:
+        return get_write_queue().submit(row_dict).result(timeout=WRITE_CONFIRM_TIMEOUT)
+    except Exception as e:
+        log.error("Queued submission not confirmed: %s", e)
+        return False
+
+# Check a returning household in. With the outbox, a main database that is
+# unreachable or locked queues the check-in locally instead of failing; the
+# result is then QUEUED, since whether the phone is on file is not known yet.
+def submit_check_in(phone, arrival_mode):
+    try:
+        return check_in(phone, arrival_mode)
+    except OperationalError as e:
+        if not OUTBOX_ENABLED:
+            raise
+        log.warning("Main database unavailable, queueing check-in: %s", getattr(e, "orig", e))
+        row_dict = {
+            CHECK_IN: True, "Phone": phone, "Arrival Mode": arrival_mode,
+            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if not get_outbox().append(row_dict):
+            raise
+        return QUEUED